@@ -6,83 +6,299 @@ Visualize ulog files.
 
 import argparse
 import os
-import subprocess
 import tempfile
 import logging
-from pyulog import ULog
-from dash import Dash, html, dcc, Output, Input, callback
-from plotly.graph_objects import Figure
+import time
+from urllib.parse import parse_qs, urlencode
+import flask
+from dash import Dash, html, dcc, dash_table, Output, Input, State, Patch, callback, ctx, no_update
+from dash import clientside_callback, get_relative_path
 
 from CustomFormatter import CustomFormatter
 from modules.actuator_motors import read_actuator_motors_data
 from modules.airspeed import read_airspeed_data
 from modules.airspeed_validated import read_airspeed_validated_data
 from modules.battery_status import read_battery_data
+from modules.batch_processor import find_ulog_files, output_formats, run_batch
 from modules.esc_status import read_esc_data
+from modules.flight_comparison import read_comparison_data
+from modules.flight_events import alignment_events
+from modules.instrumentation import enable_profiling, get_rss_bytes, get_spans, record_span
+from modules.log_catalog import query_catalog, update_catalog
+from modules.log_session import LogSessions, default_max_figures, default_max_memory_mb
 from modules.manual_control_setpoint import read_manual_control_setpoint_data
+from modules.reader_executor import executor_modes
 from modules.system_power import read_system_power_data
+from modules.table_pager import default_page_size, get_table_page
 from modules.sensor_gps import read_sensor_gps_data
-from modules.timestamp_helper import get_first_gps_timestamp
+from modules import trace_factory
+from modules.topic_cache import default_cache_size_mb
 from modules.vehicle_air_data import read_vehicle_air_data_data
 from modules.vehicle_gps_position import read_vehicle_gps_position_data
 from modules.vehicle_local_position_setpoint import read_vehicle_local_position_setpoint_data
 from modules.vehicle_thrust_setpoint import read_vehicle_thrust_setpoint_data
 from modules.sensor_combined import read_sensor_combined_data
-
-tmp_dirname = None
-ulog_filename = None
-
-subplot_height = 600
-
-tab_figures = {}
-
-
-def sanitize_fig_title(title: str):
-    return title.text.lower().replace(" ", "-")
-
-
-def add_figs_to_dash(figs: list[Figure], main_layout: html.Div):
-    # unify subplot sizes
-    for fig in figs:
-        fig.update_layout(height=len(fig._get_subplot_rows_columns()[0]) * subplot_height)
-
-    # make sure there is a tabs container
-    tabs = [child for child in main_layout.children if isinstance(child, dcc.Tabs)]
-    if len(tabs) != 1:
-        raise Exception("There must be exactly one tab in the main div!")
-    main_div_tabs = tabs[0].children
-
-    # add separate tab for each figure
-    for fig in figs:
-        main_div_tabs.append(
-            dcc.Tab(
-                label=fig.layout.title.text,
-                value=sanitize_fig_title(fig.layout.title),
+from modules.sensor_combined_spectrogram import read_sensor_combined_spectrogram_data
+
+# logs given on the command line and the directory the other logs can be opened from
+ulog_filenames = []
+log_dirname = None
+
+# loaded logs with their built figures
+log_sessions = None
+
+# the last tab of every log shows how long loading the log and building its figures took
+diagnostics_tab = "load-diagnostics"
+
+# readers of the modules shown in the analyzer, in tab order
+enabled_readers = [
+    read_battery_data,
+    read_system_power_data,
+    read_esc_data,
+    read_actuator_motors_data,
+    # present in flight review
+    # read_manual_control_setpoint_data,
+    read_airspeed_data,
+    read_airspeed_validated_data,
+    # Data included in vehicle_gps_position (with even better accuracy)
+    # read_sensor_gps_data,
+    read_vehicle_gps_position_data,
+    # present in flight review
+    # read_vehicle_air_data_data,
+    # present in flight review
+    # read_vehicle_local_position_setpoint_data,
+    # present in flight review
+    # read_vehicle_thrust_setpoint_data,
+    read_sensor_combined_data,
+    read_sensor_combined_spectrogram_data,
+]
+
+
+def get_log_filenames():
+    """This function returns the logs which can be opened, the log directory is scanned again for new logs."""
+    log_filenames = list(ulog_filenames)
+    if log_dirname is not None:
+        log_filenames.extend(name for name in find_ulog_files(log_dirname) if name not in log_filenames)
+
+    return log_filenames
+
+
+def get_log_label(ulog_filename: str):
+    if log_dirname is not None and os.path.abspath(ulog_filename).startswith(os.path.abspath(log_dirname) + os.sep):
+        return os.path.relpath(ulog_filename, log_dirname)
+    return ulog_filename
+
+
+def get_url_log(search: str):
+    return parse_qs((search or "").lstrip("?")).get("log", [None])[0]
+
+
+@callback(
+    Output("url", "search"),
+    Output("log-select", "value"),
+    Output("tabs-graph", "children"),
+    Output("tabs-graph", "value"),
+    Input("url", "search"),
+    Input("log-select", "value"),
+    State("tabs-graph", "value"),
+)
+def open_log(search, selected_filename, tab):
+    """This function opens the log selected in the dropdown or the URL (?log=...) and shows its tabs. The URL and the
+    dropdown are kept in sync, so the URL can be shared. The figures are only built when a tab is opened."""
+    if ctx.triggered_id == "log-select":
+        ulog_filename = selected_filename
+    else:
+        ulog_filename = get_url_log(search) or selected_filename
+
+    # only logs of the command line or the log directory can be opened
+    if ulog_filename not in get_log_filenames():
+        logging.error(f"Log {ulog_filename} not found!")
+        ulog_filename = selected_filename
+
+    session = log_sessions.get(ulog_filename)
+    tabs = [dcc.Tab(label=title, value=tab) for tab, title in session.tab_titles.items()]
+    tabs.append(dcc.Tab(label="Load diagnostics", value=diagnostics_tab))
+
+    # stay on the same tab when switching between logs, by default select the first tab
+    if tab != diagnostics_tab and tab not in session.tab_readers.keys():
+        tab = tabs[0].value if len(tabs) > 0 else None
+
+    return (
+        no_update if get_url_log(search) == ulog_filename else "?" + urlencode({"log": ulog_filename}),
+        no_update if selected_filename == ulog_filename else ulog_filename,
+        tabs,
+        tab,
+    )
+
+
+def get_diagnostics_table(ulog_filename: str):
+    """This function lists the timed stages of a log (see modules/instrumentation.py), nested stages are indented."""
+    spans = sorted(get_spans(ulog_filename), key=lambda record: record["start_us"])
+    if len(spans) == 0:
+        return html.P("No stages recorded for this log.")
+
+    rows = [
+        {
+            "start": round((record["start_us"] - spans[0]["start_us"]) / 1e6, 3),
+            "stage": "\u00a0\u00a0\u00a0" * record["depth"] + record["name"],
+            "category": record["category"],
+            "duration": round(record["duration_us"] / 1000, 1),
+            "rss": round(record["rss_delta_bytes"] / 1024 / 1024, 1) if "rss_delta_bytes" in record else None,
+            "heap": round(record["traced_delta_bytes"] / 1024 / 1024, 1) if "traced_delta_bytes" in record else None,
+            "thread": record["thread"],
+        }
+        for record in spans
+    ]
+    columns = {
+        "start": "Start (s)",
+        "stage": "Stage",
+        "category": "Category",
+        "duration": "Duration (ms)",
+        "rss": "RSS change (MB)",
+        "heap": "Heap change (MB, --profile)",
+        "thread": "Thread",
+    }
+
+    return html.Div(
+        [
+            html.P("Requests include serializing their response, figures are serialized once per tab."),
+            dash_table.DataTable(
+                columns=[{"name": name, "id": column} for column, name in columns.items()],
+                data=rows,
+                page_size=50,
+                style_cell={"textAlign": "left"},
+                style_table={"overflowX": "auto"},
+            ),
+        ]
+    )
+
+
+@callback(Output("tabs-content-graph", "children"), Input("tabs-graph", "value"), State("log-select", "value"))
+def render_content(tab, ulog_filename):
+    if tab is None:
+        return None
+
+    if tab == diagnostics_tab:
+        return get_diagnostics_table(ulog_filename)
+
+    session = log_sessions.get(ulog_filename)
+    if tab in session.tab_readers.keys():
+        # the browser fetches the serialized figure from /figure (see load_figure)
+        children = [
+            dcc.Store(
+                id="tab-figure-url",
+                data=get_relative_path("/figure") + "?" + urlencode({"log": ulog_filename, "tab": tab}),
+            ),
+            dcc.Graph(id="tab-graph"),
+        ]
+
+        # the rows are paged, sorted and filtered by the server (see page_table)
+        table_columns = session.get_table_columns(tab)
+        if table_columns is not None:
+            children.append(html.H3("Raw data"))
+            children.append(
+                dash_table.DataTable(
+                    id="tab-table",
+                    columns=[{"name": column, "id": column} for column in table_columns],
+                    page_current=0,
+                    page_size=default_page_size,
+                    page_action="custom",
+                    sort_action="custom",
+                    sort_mode="multi",
+                    filter_action="custom",
+                    filter_query="",
+                    style_table={"overflowX": "auto"},
+                )
             )
-        )
-
-        # save this figure in the tab_figures dictionary: {sanitized_fig_title: fig}
-        tab_figures[sanitize_fig_title(fig.layout.title)] = fig
-
-        # remove figure title because the tab name already contains it
-        fig.layout.title.text = ""
 
-    # by default select the first tab
-    if len(tabs[0].children) > 0:
-        tabs[0].value = tabs[0].children[0].value
-
-
-@callback(Output("tabs-content-graph", "children"), Input("tabs-graph", "value"))
-def render_content(tab):
-    if tab in tab_figures.keys():
-        return html.Div([dcc.Graph(figure=tab_figures[tab])])
+        return html.Div(children)
     else:
-        logging.error(f"Tab name {tab} not found in tab_figures!")
+        logging.error(f"Tab name {tab} not found in tab_readers!")
+
+
+clientside_callback(
+    """
+    function(url) {
+        if (!url) {
+            return window.dash_clientside.no_update;
+        }
+        // the cached figure is revalidated with its ETag, an unchanged figure isn't sent again
+        return fetch(url, {cache: "no-cache"}).then((response) => response.json());
+    }
+    """,
+    Output("tab-graph", "figure"),
+    Input("tab-figure-url", "data"),
+)
+
+
+@callback(
+    Output("tab-table", "data"),
+    Output("tab-table", "page_count"),
+    Input("tab-table", "page_current"),
+    Input("tab-table", "page_size"),
+    Input("tab-table", "sort_by"),
+    Input("tab-table", "filter_query"),
+    State("tabs-graph", "value"),
+    State("log-select", "value"),
+)
+def page_table(page_current, page_size, sort_by, filter_query, tab, ulog_filename):
+    """Only the visible page of the raw data table is sent to the browser."""
+    session = log_sessions.get(ulog_filename)
+    if tab not in session.tab_readers.keys() or session.get_table_columns(tab) is None:
+        return no_update, no_update
+
+    df = session.get_table(tab)
+
+    try:
+        return get_table_page(df, page_current, page_size, sort_by, filter_query)
+    except ValueError as e:
+        logging.warning(f"Ignoring table filter: {e}")
+        return get_table_page(df, page_current, page_size, sort_by)
+
+
+@callback(
+    Output("tab-graph", "figure", allow_duplicate=True),
+    Input("tab-graph", "relayoutData"),
+    State("tabs-graph", "value"),
+    State("log-select", "value"),
+    prevent_initial_call=True,
+)
+def resample_content(relayout_data, tab, ulog_filename):
+    """Re-decimates the visible window of the traces when zooming, only the changed trace data is sent back."""
+    session = log_sessions.get(ulog_filename)
+    if not relayout_data or tab not in session.tab_readers.keys():
+        return no_update
+
+    resampled_traces = trace_factory.resample_traces(session.get_figure(tab), relayout_data)
+    if len(resampled_traces) == 0:
+        return no_update
+
+    patched_figure = Patch()
+    for index, (x, y) in resampled_traces.items():
+        patched_figure["data"][index]["x"] = x
+        patched_figure["data"][index]["y"] = y
+
+    return patched_figure
+
+
+@callback(
+    Output("compare-content", "children"),
+    Input("compare-select", "value"),
+    Input("compare-event", "value"),
+)
+def compare_logs(compare_filenames, event):
+    """This function overlays several logs, aligned on the selected event."""
+    compare_filenames = [name for name in compare_filenames or [] if name in get_log_filenames()]
+    if len(compare_filenames) == 0:
+        return None
+
+    sessions = [log_sessions.get(ulog_filename) for ulog_filename in compare_filenames]
+    return dcc.Graph(id="compare-graph", figure=read_comparison_data(sessions, event))
 
 
 def main():
     """Command line interface"""
-    global ulog_filename, tmp_dirname
+    global ulog_filenames, log_dirname, log_sessions
 
     logger = logging.getLogger("root")
     logger.setLevel(logging.DEBUG)
@@ -92,100 +308,320 @@ def main():
     logger.addHandler(ch)
 
     parser = argparse.ArgumentParser(description="Plot ulog data")
-    parser.add_argument("filename", metavar="file.ulg", help="ULog input file")
-    parser.add_argument("--keep-csv", "-k", action="store_true", help="Don't delete the temporary csv files.")
+    parser.add_argument("filenames", metavar="file.ulg", nargs="*", help="ULog input files")
+    parser.add_argument("--log-dir", metavar="DIR", help="Directory with ulog files which can be opened in the app.")
+    parser.add_argument("--batch", metavar="DIR", help="Process all ulog files in DIR without starting the server.")
+    parser.add_argument("--output", metavar="DIR", help="Output directory of the batch mode.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes or threads (default: CPU count).")
+    parser.add_argument(
+        "--output-format", choices=output_formats, default="html", help="Figure format of the batch mode."
+    )
+    parser.add_argument(
+        "--prebuild", action="store_true", help="Build the figures of the first tabs concurrently at startup."
+    )
+    parser.add_argument(
+        "--reader-executor",
+        choices=executor_modes,
+        help="How the readers of a log are run: auto (threads, processes for CPU heavy readers), thread, process or "
+        "serial (default: auto, serial in the batch mode because the logs already run in parallel).",
+    )
+    parser.add_argument("--keep-csv", "-k", action="store_true", help="Export the topics as csv files.")
+    parser.add_argument("--cache-dir", help="Directory of the decoded topic cache (default: next to the ulog file).")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=default_cache_size_mb,
+        help=f"Maximum size of the topic cache in MB (default: {default_cache_size_mb}).",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Don't use the decoded topic cache (the message offset index is kept)."
+    )
+    parser.add_argument(
+        "--max-figures",
+        type=int,
+        default=default_max_figures,
+        help=f"Maximum number of built figures kept in memory per log (default: {default_max_figures}).",
+    )
+    parser.add_argument(
+        "--max-log-memory",
+        type=int,
+        default=default_max_memory_mb,
+        help=f"Memory in MB of the loaded logs before the least recently used ones are closed "
+        f"(default: {default_max_memory_mb}).",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=trace_factory.target_point_count,
+        help=f"Number of points per trace sent to the browser, 0 disables the decimation "
+        f"(default: {trace_factory.target_point_count}).",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve the app with a multi-threaded WSGI server (waitress) and compressed responses instead of the "
+        "debug server.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host of the --serve mode, e.g. 0.0.0.0 to share it.")
+    parser.add_argument("--port", type=int, default=8050, help="Port of the --serve mode (default: 8050).")
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Number of server threads of the --serve mode (default: 8)."
+    )
+    parser.add_argument(
+        "--start",
+        metavar="TIME",
+        help="Only analyze the log from TIME on: seconds since the start of the log (e.g. 120) or a UTC date and time "
+        "(e.g. 2023-11-14T22:13:40).",
+    )
+    parser.add_argument("--end", metavar="TIME", help="Only analyze the log up to TIME, see --start.")
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write the timed stages as Chrome trace JSON (chrome://tracing, Perfetto, speedscope) to FILE at exit. "
+        "Also traces the Python heap, which is slower.",
+    )
+    parser.add_argument(
+        "--catalog", metavar="FILE", help="SQLite catalog of per-log field statistics for --index and --query."
+    )
+    parser.add_argument("--index", metavar="DIR", help="Add the new and changed logs of DIR to the --catalog.")
+    parser.add_argument(
+        "--query",
+        metavar="QUERY",
+        help="Find logs in the --catalog, e.g. 'esc_status.esc[*].esc_temperature max > 90' or "
+        "'battery_status.voltage_v min < 20'.",
+    )
     args = parser.parse_args()
 
-    if not os.path.exists(args.filename):
-        print(f'File "{args.filename}" doesn\'t exist.')
-        exit(1)
-    elif not str(args.filename).endswith(".ulg"):
-        print(f'File "{args.filename}" must be an *.ulg file.')
-        exit(1)
-    else:
-        ulog_filename = args.filename
-
-    ulog = ULog(args.filename, None, True)
-    get_first_gps_timestamp(ulog)
-
-    with tempfile.TemporaryDirectory(delete=not args.keep_csv) as tmp_dirname:
-        if args.keep_csv:
-            logging.info(f"CSV files: {tmp_dirname}")
-
-        # convert ulog file to csvs
-        cmd = f"ulog2csv -o {tmp_dirname} {args.filename}"
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            shell=True,
-            universal_newlines=True,
-        )
-        std_out, _ = proc.communicate()
+    if args.profile:
+        enable_profiling(args.profile)
 
-        if proc.returncode:
-            print("Couldn't convert ulog file to csv. Error:")
-            print(std_out)
+    if args.index or args.query:
+        if not args.catalog:
+            print("--index and --query require a --catalog file.")
             exit(1)
 
-        external_stylesheets = ["style.css"]
-        app = Dash(name="ulog analyzer", external_stylesheets=external_stylesheets)
-
-        app.layout = html.Div(
-            id="main_div",
-            children=[
-                html.H1("ulog analyzer"),
-                dcc.Tabs(
-                    id="tabs-graph",
-                    value="tabs-graph",
-                    children=[],
-                ),
-                html.Div(id="tabs-content-graph"),
-            ],
-        )
-
-        add_figs_to_dash(read_battery_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
-
-        add_figs_to_dash(read_system_power_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
-
-        add_figs_to_dash(read_esc_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
-
-        add_figs_to_dash(read_actuator_motors_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
-
-        # present in flight review
-        # add_figs_to_dash(
-        #    read_manual_control_setpoint_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout
-        # )
+        failed_count = 0
+        if args.index:
+            failed_count = update_catalog(
+                args.catalog,
+                args.index,
+                enabled_readers,
+                args.workers,
+                use_cache=not args.no_cache,
+                cache_dir=args.cache_dir,
+                cache_size_mb=args.cache_size,
+            )
 
-        add_figs_to_dash(read_airspeed_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
+        if args.query:
+            try:
+                results = query_catalog(args.catalog, args.query)
+            except ValueError as e:
+                print(e)
+                exit(1)
+
+            # one line per matching field, the log can be opened with ?log=PATH
+            for result in results:
+                print(
+                    "\t".join(
+                        str(value)
+                        for key, value in result.items()
+                        if key not in ["message_name", "timestamp"] and value is not None
+                    )
+                    + "\t?"
+                    + urlencode({"log": result["ulog_filename"]})
+                )
+
+        exit(1 if failed_count else 0)
+
+    if args.batch:
+        if not args.output:
+            print("The batch mode requires an --output directory.")
+            exit(1)
 
-        add_figs_to_dash(
-            read_airspeed_validated_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout
+        failed_count = run_batch(
+            args.batch,
+            args.output,
+            enabled_readers,
+            args.workers,
+            output_format=args.output_format,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            cache_size_mb=args.cache_size,
+            max_points=args.max_points,
+            reader_executor=args.reader_executor or "serial",
+            start=args.start,
+            end=args.end,
         )
+        exit(1 if failed_count else 0)
 
-        # Data included in vehicle_gps_position (with even better accuracy)
-        # add_figs_to_dash(read_sensor_gps_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
-
-        add_figs_to_dash(
-            read_vehicle_gps_position_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout
-        )
+    for filename in args.filenames:
+        if not os.path.exists(filename):
+            print(f'File "{filename}" doesn\'t exist.')
+            exit(1)
+        elif not str(filename).endswith(".ulg"):
+            print(f'File "{filename}" must be an *.ulg file.')
+            exit(1)
 
-        # present in flight review
-        # add_figs_to_dash(read_vehicle_air_data_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
+    ulog_filenames = args.filenames
+    log_dirname = args.log_dir
+    if len(get_log_filenames()) == 0:
+        parser.error("file.ulg, --log-dir DIR with ulog files or --batch DIR is required")
+
+    trace_factory.target_point_count = args.max_points
+
+    log_sessions = LogSessions(
+        enabled_readers,
+        max_memory_mb=args.max_log_memory,
+        max_figures=args.max_figures,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        cache_size_mb=args.cache_size,
+        export_dirname=tempfile.mkdtemp() if args.keep_csv else None,
+        start=args.start,
+        end=args.end,
+    )
+
+    # the first log is opened by default
+    first_session = log_sessions.get(get_log_filenames()[0])
+    if args.prebuild:
+        first_session.prebuild_figures(args.reader_executor or "auto", args.workers)
+
+    app = create_app(compress=args.serve)
+
+    if args.serve:
+        serve(app, args.host, args.port, args.threads)
+    else:
+        # the reloader would load the log again in a child process, which also writes the --profile trace
+        app.run(debug=True, use_reloader=not args.profile)
+
+
+def get_layout():
+    # created for every page load, so new logs of the log directory show up
+    log_filenames = get_log_filenames()
+
+    return html.Div(
+        id="main_div",
+        children=[
+            dcc.Location(id="url", refresh=False),
+            html.H1("ulog analyzer"),
+            dcc.Dropdown(
+                id="log-select",
+                options=[{"label": get_log_label(name), "value": name} for name in log_filenames],
+                value=log_filenames[0],
+                clearable=False,
+            ),
+            dcc.Tabs(
+                id="tabs-graph",
+                value=None,
+                children=[],
+            ),
+            html.Div(id="tabs-content-graph"),
+            html.Details(
+                children=[
+                    html.Summary("Compare flights"),
+                    dcc.Dropdown(
+                        id="compare-select",
+                        options=[{"label": get_log_label(name), "value": name} for name in log_filenames],
+                        value=[],
+                        multi=True,
+                        placeholder="Logs to compare",
+                    ),
+                    dcc.RadioItems(
+                        id="compare-event",
+                        options=[{"label": f"Align on {event}", "value": event} for event in alignment_events],
+                        value=alignment_events[0],
+                        inline=True,
+                    ),
+                    html.Div(id="compare-content"),
+                ],
+            ),
+        ],
+    )
+
+
+def create_app(compress: bool = False):
+    """This function creates the Dash app. compress enables gzip/brotli compressed responses (requires
+    Flask-Compress)."""
+    external_stylesheets = ["style.css"]
+    # the graph of the tabs is created dynamically
+    app = Dash(
+        name="ulog analyzer",
+        external_stylesheets=external_stylesheets,
+        suppress_callback_exceptions=True,
+        compress=compress,
+    )
+
+    app.layout = get_layout
+
+    @app.server.route("/figure")
+    def load_figure():
+        """Serves the figure of a tab as JSON, serialized once per figure. The browser caches the figure and only
+        revalidates it with its ETag, so switching back to a tab doesn't send the figure again."""
+        ulog_filename = flask.request.args.get("log")
+        if ulog_filename not in get_log_filenames():
+            flask.abort(404)
+
+        session = log_sessions.get(ulog_filename)
+        tab = flask.request.args.get("tab")
+        if tab not in session.tab_readers.keys():
+            flask.abort(404)
+
+        figure_json, etag = session.get_figure_json(tab)
+
+        # with --serve, Flask-Compress appends the encoding to the ETag ("<etag>:gzip"), which the browser sends back
+        client_etags = {value.rsplit(":", 1)[0] for value in flask.request.if_none_match.as_set()}
+        if etag in client_etags:
+            # not modified, nothing is sent (or compressed) again
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(figure_json, mimetype="application/json")
+
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    @app.server.before_request
+    def start_request_span():
+        flask.g.request_rss = get_rss_bytes()
+        flask.g.request_start_time = time.perf_counter()
+
+    @app.server.after_request
+    def record_request_span(response):
+        """Callback requests are timed including the serialization of their response."""
+        if flask.request.path.endswith("_dash-update-component"):
+            payload = flask.request.get_json(silent=True) or {}
+            log = next(
+                (
+                    item.get("value")
+                    for item in payload.get("inputs", []) + payload.get("state", [])
+                    if isinstance(item, dict) and item.get("id") == "log-select"
+                ),
+                None,
+            )
+            # multiple outputs are joined like ..id.property...id.property..
+            outputs = " ".join(str(payload.get("output", "")).strip(".").split("..."))
+            record_span(
+                f"request {outputs}",
+                "request",
+                flask.g.request_start_time,
+                flask.g.request_rss,
+                log=log,
+                response_bytes=response.content_length,
+            )
+        return response
 
-        # present in flight review
-        # add_figs_to_dash(
-        #     read_vehicle_local_position_setpoint_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout
-        # )
+    return app
 
-        # present in flight review
-        # add_figs_to_dash(
-        #     read_vehicle_thrust_setpoint_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout
-        # )
 
-        add_figs_to_dash(read_sensor_combined_data(tmp_dirname=tmp_dirname, ulog_filename=ulog_filename), app.layout)
+def serve(app: Dash, host: str, port: int, threads: int):
+    """This function serves the app with a multi-threaded WSGI server instead of the single-threaded debug server.
+    Every log is only loaded once, all threads share its topics and figures read-only."""
+    # only needed for this mode
+    from waitress import serve as serve_wsgi
 
-        app.run(debug=True)
+    logging.info(f"Serving on http://{host}:{port} with {threads} threads")
+    serve_wsgi(app.server, host=host, port=port, threads=threads)
 
 
 if __name__ == "__main__":
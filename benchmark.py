@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the analyzer pipeline on synthetic ulog files.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from CustomFormatter import CustomFormatter
+from analyze import enabled_readers
+from modules import trace_factory
+from modules.figure_json import serialize_figure
+from modules.reader_executor import build_figure, get_reader_jobs, run_reader_jobs
+from modules.synthetic_ulog import default_multi_instances, default_rates, write_synthetic_ulog
+from modules.timestamp_helper import get_time_base
+from modules.topic_source import TopicSource, get_reader_module, get_required_fields, load_log
+from modules.ulog_reader import UlogReader
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory isn't reported there
+    resource = None
+
+# version of the report layout, increase it if the keys or what they measure change
+report_version = 4
+
+# the message offset index of a log (8 bytes per data message plus temporary copies while the log is scanned) is the
+# only memory which may grow with the duration of the log when it is loaded on a topic cache miss
+index_bytes_per_message = 24
+
+# growth of the peak memory tolerated by --memory-check on top of the offset index
+memory_check_tolerance_mb = 16
+
+
+def parse_topic_values(values: list, value_type):
+    """This function parses TOPIC=VALUE arguments into {topic: value}."""
+    result = {}
+    for value in values or []:
+        topic, _, number = value.partition("=")
+        if topic not in default_rates or not number:
+            raise Exception(f"Invalid value {value}, expected TOPIC=NUMBER with TOPIC one of {list(default_rates)}")
+        result[topic] = value_type(number)
+
+    return result
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_peak_memory_mb():
+    try:
+        # unlike ru_maxrss, the peak of a process which was started with fork and exec (e.g. a spawned worker) doesn't
+        # include the memory of its parent at the time of the fork
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+
+    # kilobytes on Linux, bytes on macOS
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_memory / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class StageTimer:
+    """Collects the run times of the benchmarked stages: {stage: [seconds of every run]}."""
+
+    def __init__(self):
+        self.times = {}
+
+    def measure(self, stage: str, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        self.times.setdefault(stage, []).append(time.perf_counter() - start_time)
+        return result
+
+    def get_report(self):
+        # the fastest run is the least disturbed by the rest of the system
+        return {stage: {"min_s": min(times), "runs_s": times} for stage, times in self.times.items()}
+
+
+def run_pipeline(ulog_filename: str, timer: StageTimer, sizes: dict, baseline: bool):
+    """This function runs the stages of the analyzer once: parse the log, convert the topics, fit the time base and
+    read, build and serialize the figure of every module."""
+    required_fields = get_required_fields(enabled_readers + [get_time_base])
+
+    with timer.measure("parse", UlogReader, ulog_filename) as reader:
+        topic_source = timer.measure("convert", TopicSource.from_ulog_reader, reader, required_fields)
+        time_base = timer.measure("time_base", get_time_base, topic_source)
+
+        if baseline:
+            # pyulog decodes the whole log in one step, compare it with parse + convert
+            from pyulog import ULog
+
+            timer.measure("pyulog", ULog, ulog_filename, list(required_fields.keys()))
+
+        for title, reader_function, dataset_num in get_reader_jobs(enabled_readers, topic_source):
+            module = get_reader_module(reader_function)
+            # decode only the topic and fields of this module (the convert stage decodes all of them at once)
+            fields = get_required_fields([reader_function])[module.message_name]
+            timer.measure(f"read/{title}", reader.read_topic, module.message_name, dataset_num, None, None, fields)
+
+            fig = timer.measure(f"figure/{title}", build_figure, reader_function, topic_source, time_base, dataset_num)
+            sizes[title] = len(timer.measure(f"serialize/{title}", serialize_figure, fig))
+
+            # the full resolution data of the traces would keep the topics of every run alive
+            trace_factory.release_figure(fig)
+
+
+def measure_streaming_memory(ulog_filename: str):
+    """This function loads a log on a topic cache miss and builds the IMU figures, which stream their topic from the
+    cache. Runs in a fresh process, so the peak memory is the one of this log only."""
+    readers = [reader for reader in enabled_readers if get_reader_module(reader).message_name == "sensor_combined"]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        topic_source, time_base, _ = load_log(ulog_filename, readers, cache_dir=cache_dir)
+        run_reader_jobs(get_reader_jobs(readers, topic_source), topic_source, time_base, "serial")
+
+    return get_peak_memory_mb()
+
+
+def check_memory(durations: list[float], rates: dict, multi_instances: dict, seed: int):
+    """This function compares the peak memory of measure_streaming_memory for synthetic logs of the given durations.
+    It passes if the peak memory of the longest log grew by no more than the offset index of its additional
+    messages."""
+    logs = []
+    for duration in sorted(durations):
+        with tempfile.TemporaryDirectory() as dirname:
+            ulog_filename = os.path.join(dirname, "memory_check.ulg")
+            message_count = write_synthetic_ulog(ulog_filename, duration, rates, multi_instances, 10, seed)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                peak_memory_mb = executor.submit(measure_streaming_memory, ulog_filename).result()
+
+        logs.append({"duration_s": duration, "message_count": message_count, "peak_memory_mb": peak_memory_mb})
+
+    growth_mb = logs[-1]["peak_memory_mb"] - logs[0]["peak_memory_mb"]
+    allowed_growth_mb = (logs[-1]["message_count"] - logs[0]["message_count"]) * index_bytes_per_message / (
+        1024 * 1024
+    ) + memory_check_tolerance_mb
+    return {
+        "logs": logs,
+        "growth_mb": growth_mb,
+        "allowed_growth_mb": allowed_growth_mb,
+        "passed": growth_mb <= allowed_growth_mb,
+    }
+
+
+def main():
+    """Command line interface"""
+    logger = logging.getLogger("root")
+    logger.setLevel(logging.WARNING)
+    ch = logging.StreamHandler()
+    ch.setFormatter(CustomFormatter())
+    logger.addHandler(ch)
+
+    parser = argparse.ArgumentParser(description="Benchmark the analyzer on a synthetic ulog file")
+    parser.add_argument("--duration", type=float, default=600, help="Duration of the log in seconds (default: 600).")
+    parser.add_argument(
+        "--rate",
+        metavar="TOPIC=HZ",
+        action="append",
+        help="Rate of a topic, e.g. sensor_combined=1000 (repeatable, default rates see modules/synthetic_ulog.py).",
+    )
+    parser.add_argument(
+        "--multi", metavar="TOPIC=N", action="append", help="Number of instances of a topic, e.g. battery_status=2."
+    )
+    parser.add_argument(
+        "--topics", nargs="+", metavar="TOPIC", help="Only log these topics (default: all topics with a rate)."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of every stage (default: 3).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated signals.")
+    parser.add_argument("--baseline", action="store_true", help="Also time decoding the log with pyulog.")
+    parser.add_argument(
+        "--memory-check",
+        nargs=2,
+        type=float,
+        metavar="SECONDS",
+        help="Also check that the peak memory of loading a log on a topic cache miss and building the IMU figures "
+        "stays flat for two log durations, e.g. 900 3600. Exits with 1 if it grew by more than the offset index.",
+    )
+    parser.add_argument("--ulog", metavar="FILE", help="Keep the generated log in FILE instead of a temporary file.")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON report to FILE instead of stdout.")
+    args = parser.parse_args()
+
+    try:
+        rates = {**default_rates, **parse_topic_values(args.rate, float)}
+        multi_instances = {**default_multi_instances, **parse_topic_values(args.multi, int)}
+    except Exception as e:
+        parser.error(str(e))
+
+    if args.topics:
+        rates = {topic: rate for topic, rate in rates.items() if topic in args.topics}
+
+    if args.memory_check and get_peak_memory_mb() is None:
+        parser.error("The peak memory can't be measured on this platform")
+
+    ulog_filename = args.ulog or os.path.join(tempfile.mkdtemp(), "benchmark.ulg")
+
+    timer = StageTimer()
+    message_count = timer.measure(
+        "generate", write_synthetic_ulog, ulog_filename, args.duration, rates, multi_instances, 10, args.seed
+    )
+
+    sizes = {}
+    for run in range(args.repeat):
+        print(f"Run {run + 1} of {args.repeat}", file=sys.stderr)
+        run_pipeline(ulog_filename, timer, sizes, args.baseline)
+
+    report = {
+        "version": report_version,
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "duration_s": args.duration,
+            "rates": rates,
+            "multi_instances": {topic: count for topic, count in multi_instances.items() if topic in rates},
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "log": {"size_bytes": os.path.getsize(ulog_filename), "message_count": message_count},
+        "stages": timer.get_report(),
+        "figure_json_bytes": sizes,
+        "peak_memory_mb": get_peak_memory_mb(),
+        "memory_check": None,
+    }
+
+    if args.memory_check:
+        print("Memory check", file=sys.stderr)
+        report["memory_check"] = check_memory(args.memory_check, rates, multi_instances, args.seed)
+
+    if not args.ulog:
+        os.remove(ulog_filename)
+        os.rmdir(os.path.dirname(ulog_filename))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if report["memory_check"] is not None and not report["memory_check"]["passed"]:
+        logging.error(
+            f"The peak memory grew by {report['memory_check']['growth_mb']:.0f} MB, "
+            f"allowed are {report['memory_check']['allowed_growth_mb']:.0f} MB"
+        )
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
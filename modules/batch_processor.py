@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from modules import trace_factory
+from modules.instrumentation import add_spans, pop_spans, span
+from modules.reader_executor import get_reader_jobs, run_reader_jobs
+from modules.table_pager import get_table_data
+from modules.topic_cache import default_cache_size_mb
+from modules.topic_source import get_reader_module, load_log
+
+output_formats = ["html", "json"]
+
+
+def find_ulog_files(dirname: str):
+    ulog_filenames = []
+    for root, _, filenames in os.walk(dirname):
+        ulog_filenames.extend(os.path.join(root, name) for name in filenames if name.endswith(".ulg"))
+
+    return sorted(ulog_filenames)
+
+
+def get_figure_filename(title: str):
+    return title.lower().replace(" ", "-").replace("/", "-")
+
+
+def process_log(
+    ulog_filename: str,
+    output_dirname: str,
+    readers: list,
+    output_format: str = "html",
+    use_cache: bool = True,
+    cache_dir: str = None,
+    cache_size_mb: int = default_cache_size_mb,
+    max_points: int = trace_factory.target_point_count,
+    reader_executor: str = "serial",
+    start: str = None,
+    end: str = None,
+):
+    """This function runs the readers for a single log and writes their figures and a summary.json into
+    output_dirname/<log name>. Errors of the log (e.g. a corrupt file) don't raise, they are reported in the summary.
+    """
+    start_time = time.perf_counter()
+    log_output_dirname = os.path.join(output_dirname, os.path.splitext(os.path.basename(ulog_filename))[0])
+    summary = {"ulog_filename": ulog_filename, "output_dirname": log_output_dirname, "figures": []}
+    # a forked worker starts with a copy of the spans of the main process
+    pop_spans()
+
+    # created upfront, so the summary of a log which can't even be loaded is written as well
+    os.makedirs(log_output_dirname, exist_ok=True)
+
+    try:
+        trace_factory.target_point_count = max_points
+
+        with span("load log", log=ulog_filename):
+            topic_source, time_base, time_range_us = load_log(
+                ulog_filename, readers, use_cache, cache_dir, cache_size_mb, start, end
+            )
+        if time_range_us is not None:
+            summary["time_range_us"] = time_range_us
+
+        reader_start_time = time.perf_counter()
+
+        jobs = get_reader_jobs(readers, topic_source)
+        with span("build figures", log=ulog_filename):
+            figures = run_reader_jobs(jobs, topic_source, time_base, reader_executor)
+
+        for (title, reader, dataset_num), fig in zip(jobs, figures):
+            figure_filename = os.path.join(log_output_dirname, f"{get_figure_filename(title)}.{output_format}")
+            if output_format == "html":
+                fig.write_html(figure_filename, include_plotlyjs="cdn")
+            else:
+                fig.write_json(figure_filename)
+
+            trace_factory.release_figure(fig)
+
+            # raw data tables aren't part of the figures
+            module = get_reader_module(reader)
+            if getattr(module, "table_columns", None) is not None:
+                get_table_data(topic_source, time_base, module.message_name, dataset_num, module.table_columns).to_csv(
+                    os.path.join(log_output_dirname, f"{get_figure_filename(title)}-table.csv"), index=False
+                )
+
+            summary["figures"].append(
+                {
+                    "title": title,
+                    "message_name": module.message_name,
+                    "multi_id": dataset_num,
+                    "filename": figure_filename,
+                }
+            )
+
+        summary["reader_seconds"] = time.perf_counter() - reader_start_time
+    except Exception:
+        summary["error"] = traceback.format_exc()
+
+    summary["seconds"] = time.perf_counter() - start_time
+
+    with open(os.path.join(log_output_dirname, "summary.json"), "w") as file:
+        json.dump(summary, file, indent=4)
+
+    # the spans of the worker process are recorded by the main process (see run_batch)
+    summary["spans"] = pop_spans()
+    return summary
+
+
+def run_batch(input_dirname: str, output_dirname: str, readers: list, workers: int = None, **kwargs):
+    """This function processes all logs of input_dirname in a process pool and writes a summary.json of all logs
+    into output_dirname. Returns the number of failed logs."""
+    ulog_filenames = find_ulog_files(input_dirname)
+    logging.info(f"Found {len(ulog_filenames)} ulog files in {input_dirname}")
+
+    start_time = time.perf_counter()
+    failed_count = 0
+    log_summaries = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_log, ulog_filename, output_dirname, readers, **kwargs): ulog_filename
+            for ulog_filename in ulog_filenames
+        }
+
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception:
+                # e.g. a worker process that got killed
+                summary = {"ulog_filename": futures[future], "seconds": 0, "error": traceback.format_exc()}
+
+            add_spans(summary.pop("spans", []))
+            log_summaries.append(
+                {
+                    "ulog_filename": summary["ulog_filename"],
+                    "seconds": summary["seconds"],
+                    "figure_count": len(summary.get("figures", [])),
+                    "error": summary.get("error"),
+                }
+            )
+
+            if "error" in summary:
+                failed_count += 1
+                logging.error(f"{summary['ulog_filename']} failed after {summary['seconds']:.1f} s:")
+                logging.error(summary["error"])
+            else:
+                logging.info(
+                    f"{summary['ulog_filename']}: {len(summary['figures'])} figures in {summary['seconds']:.1f} s"
+                )
+
+    seconds = time.perf_counter() - start_time
+    logging.info(f"Processed {len(ulog_filenames)} logs in {seconds:.1f} s, {failed_count} failed")
+
+    os.makedirs(output_dirname, exist_ok=True)
+    with open(os.path.join(output_dirname, "summary.json"), "w") as file:
+        json.dump(
+            {
+                "input_dirname": input_dirname,
+                "seconds": seconds,
+                "failed_count": failed_count,
+                # in the order of the logs, not of their completion
+                "logs": sorted(log_summaries, key=lambda log_summary: log_summary["ulog_filename"]),
+            },
+            file,
+            indent=4,
+        )
+
+    return failed_count
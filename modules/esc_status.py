@@ -1,185 +1,93 @@
-import logging
-import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-
-from modules.csv_reader import get_csv_file, get_multi_id_num
-from modules.figure_formatter import format_figure
-from modules.timestamp_helper import fix_timestamps
-
-
-def read_esc_data(tmp_dirname: str, ulog_filename: str):
-    message_name = "esc_status"
-
-    dataset_count = get_multi_id_num(tmp_dirname, message_name)
-    logging.info(f"Found {dataset_count} {message_name} data sets")
-
-    timestamp_field = "timestamp"
-
-    figs = []
-
-    for dataset_num in range(dataset_count):
-        # read in csv
-        df = pd.read_csv(get_csv_file(tmp_dirname, ulog_filename, message_name, dataset_num))
-        fix_timestamps(df, timestamp_field)
-
-        motor_count = 4
-
-        rows = 8
-        subplot_titles = [
-            "Error count",
-            "RPM",
-            "Temperature",
-            "Voltage",
-            "Current",
-            "Failures",
-            "State",
-            "Power",
-        ]
-        if len(subplot_titles) != rows:
-            raise Exception("Number of subplots is wrong")
-
-        fig = make_subplots(
-            rows=rows,
-            cols=1,
-            vertical_spacing=0.02,
-            shared_xaxes=True,
-            subplot_titles=subplot_titles,
-        )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=1,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_errorcount"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=2,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_rpm"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        fig.add_trace(
-            col=1,
-            row=2,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=sum([df[f"esc[{x}].esc_rpm"] for x in range(motor_count)]),
-                mode="lines",
-                name=f"Total motor RPM",
-                visible="legendonly",
-            ),
-        )
-
-        for x in range(motor_count):
+from modules.figure_spec import render_figure
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
+
+message_name = "esc_status"
+
+figure_title = "ESC"
+
+motor_count = 4
+
+required_fields = ["timestamp"] + [
+    f"esc[{x}].{field}"
+    for x in range(motor_count)
+    for field in [
+        "esc_errorcount",
+        "esc_rpm",
+        "esc_temperature",
+        "esc_voltage",
+        "esc_current",
+        "failures",
+        "esc_state",
+        "esc_power",
+    ]
+]
+
+# the log catalog stores how long these fields were above the threshold: {field: threshold}
+catalog_thresholds = {f"esc[{x}].esc_temperature": 90 for x in range(motor_count)}
+
+# error counters, the log catalog stores how much they increased during the log
+counter_fields = [f"esc[{x}].esc_errorcount" for x in range(motor_count)]
+
+
+# subplots of the figure, see modules/figure_spec.py
+figure_spec = {
+    "timestamp_field": "timestamp",
+    "rows": [
+        {
+            "title": "Error count",
+            "traces": [{"field": "esc[{index}].esc_errorcount", "name": "Motor {number}", "count": motor_count}],
+        },
+        {
+            "title": "RPM",
+            "unit": " RPM",
+            "traces": [
+                {"field": "esc[{index}].esc_rpm", "name": "Motor {number}", "count": motor_count},
+                {
+                    "function": lambda df: sum(df[f"esc[{x}].esc_rpm"] for x in range(motor_count)),
+                    "name": "Total motor RPM",
+                    "visible": "legendonly",
+                },
+            ],
+        },
+        {
+            "title": "Temperature",
+            "unit": "°C",
             # ESC reports negative temperature when it's not armed
-            df[f"esc[{x}].esc_temperature"] = df[f"esc[{x}].esc_temperature"].abs()
-
-            fig.add_trace(
-                col=1,
-                row=3,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_temperature"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=4,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_voltage"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=5,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_current"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=6,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].failures"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=7,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_state"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        for x in range(motor_count):
-            fig.add_trace(
-                col=1,
-                row=8,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"esc[{x}].esc_power"],
-                    mode="lines",
-                    name=f"Motor {x+1}",
-                ),
-            )
-
-        format_figure(fig)
-
-        # show x axis labels in every subplot
-        fig.update_layout(
-            title_text=f"ESC {dataset_num}",
-            autosize=True,
-            xaxis_showticklabels=True,
-            xaxis2_showticklabels=True,
-            xaxis3_showticklabels=True,
-            xaxis4_showticklabels=True,
-            xaxis5_showticklabels=True,
-            xaxis6_showticklabels=True,
-            xaxis7_showticklabels=True,
-            xaxis8_showticklabels=True,
-            yaxis2={"ticksuffix": " RPM"},
-            yaxis3={"ticksuffix": "°C"},
-            yaxis4={"ticksuffix": "V"},
-            yaxis5={"ticksuffix": "A"},
-            yaxis7={"ticksuffix": "V"},
-            yaxis8={"ticksuffix": "%"},
-        )
-
-        figs.append(fig)
-
-    return figs
+            "traces": [
+                {"field": "esc[{index}].esc_temperature", "name": "Motor {number}", "count": motor_count, "abs": True}
+            ],
+        },
+        {
+            "title": "Voltage",
+            "unit": "V",
+            "traces": [{"field": "esc[{index}].esc_voltage", "name": "Motor {number}", "count": motor_count}],
+        },
+        {
+            "title": "Current",
+            "unit": "A",
+            "traces": [{"field": "esc[{index}].esc_current", "name": "Motor {number}", "count": motor_count}],
+        },
+        {
+            "title": "Failures",
+            "traces": [{"field": "esc[{index}].failures", "name": "Motor {number}", "count": motor_count}],
+        },
+        {
+            "title": "State",
+            "unit": "V",
+            "traces": [{"field": "esc[{index}].esc_state", "name": "Motor {number}", "count": motor_count}],
+        },
+        {
+            "title": "Power",
+            "unit": "%",
+            "traces": [{"field": "esc[{index}].esc_power", "name": "Motor {number}", "count": motor_count}],
+        },
+    ],
+}
+
+
+def read_esc_data(topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    # read in topic data
+    df = topic_source.get_data_frame(message_name, dataset_num)
+
+    return render_figure(figure_spec, df, time_base, f"{figure_title} {dataset_num}")
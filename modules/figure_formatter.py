@@ -1,6 +1,11 @@
 from plotly.graph_objects import Figure
 
+from modules.instrumentation import span
 
+subplot_height = 600
+
+
+@span("format_figure")
 def format_figure(fig: Figure):
     for i, yaxis in enumerate(fig.select_yaxes(), 1):
         legend_name = f"legend{i}"
@@ -11,3 +16,10 @@ def format_figure(fig: Figure):
             showlegend=True,
         )
         fig.update_traces(row=i, legend=legend_name)
+
+
+@span("set_figure_height")
+def set_figure_height(fig: Figure):
+    # unify subplot sizes, the figures have one y axis per row (figure specs aren't built with make_subplots)
+    row_count = sum(1 for _ in fig.select_yaxes())
+    fig.update_layout(height=row_count * subplot_height)
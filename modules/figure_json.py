@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import numpy as np
+import plotly.io as pio
+from plotly.graph_objects import Figure
+
+# numpy types plotly.js decodes from base64 typed arrays, 64 bit integers aren't supported
+typed_array_types = {
+    "float64": "f8",
+    "float32": "f4",
+    "int32": "i4",
+    "uint32": "u4",
+    "int16": "i2",
+    "uint16": "u2",
+    "int8": "i1",
+    "uint8": "u1",
+}
+
+# trace properties which hold the data arrays
+array_properties = ["x", "y", "z", "customdata"]
+
+
+def to_typed_array(values: np.ndarray):
+    """This function encodes a numeric array as plotly.js typed array spec ({dtype, bdata, shape}), which the browser
+    decodes without parsing a JSON number per value. Datetimes become milliseconds since epoch."""
+    if values.dtype.kind == "M":
+        values = values.astype("datetime64[us]").astype(np.int64) / 1000
+    elif values.dtype.kind == "b":
+        values = values.astype(np.uint8)
+    elif values.dtype.kind in "iu" and values.dtype.name not in typed_array_types:
+        values = values.astype(np.float64)
+
+    if values.dtype.name not in typed_array_types or values.size == 0:
+        return values
+
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    typed_array = {"dtype": typed_array_types[values.dtype.name], "bdata": base64.b64encode(values).decode("ascii")}
+    if values.ndim > 1:
+        typed_array["shape"] = ", ".join(str(size) for size in values.shape)
+
+    return typed_array
+
+
+def serialize_figure(fig: Figure):
+    """This function serializes a figure to JSON bytes with the numeric arrays as base64 typed arrays. plotly uses
+    orjson for the rest of the figure if it is installed."""
+    fig_dict = fig.to_plotly_json()
+
+    for trace in fig_dict["data"]:
+        for key in array_properties:
+            values = trace.get(key)
+            if not isinstance(values, np.ndarray):
+                continue
+
+            if key == "x" and values.dtype.kind == "M":
+                # numbers are only read as milliseconds since epoch on date axes
+                axis_name = "xaxis" + trace.get("xaxis", "x")[1:]
+                fig_dict["layout"].setdefault(axis_name, {})["type"] = "date"
+
+            trace[key] = to_typed_array(values)
+
+    return pio.json.to_json_plotly(fig_dict).encode()
+
+
+def get_etag(figure_json: bytes):
+    return hashlib.blake2b(figure_json, digest_size=16).hexdigest()
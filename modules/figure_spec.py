@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from modules.instrumentation import span
+from modules.timestamp_helper import TimeBase
+from modules.trace_factory import get_scatter_properties
+
+# The figures of most modules are declared as figure_spec = {"timestamp_field", "rows", optional "vertical_spacing"}.
+# Every row is a subplot: {"title", optional "unit" (y axis tick suffix), "traces"}. A trace is
+# {"field" or "function", "name"} plus optional
+#   "count": the trace is repeated count times, "{index}" in the field and "{number}" (index + 1) in the name are
+#            replaced, e.g. {"field": "esc[{index}].esc_rpm", "name": "Motor {number}", "count": 4}
+#   "scale": factor of the values, e.g. 100 for ratios shown in %
+#   "abs": plot the absolute values
+#   "optional": skip the trace if the field wasn't logged
+#   "function": function(df) which returns the values, for traces combining several fields
+# and any further scatter properties, e.g. "visible": "legendonly".
+trace_spec_keys = ["field", "function", "name", "count", "scale", "abs", "optional"]
+
+default_vertical_spacing = 0.02
+
+
+def get_trace_values(df: pd.DataFrame, trace_spec: dict, field: str):
+    values = trace_spec["function"](df) if "function" in trace_spec else df[field]
+    values = np.asarray(values)
+
+    if "scale" in trace_spec:
+        values = values * trace_spec["scale"]
+    if trace_spec.get("abs"):
+        values = np.abs(values)
+
+    return values
+
+
+def expand_trace_spec(trace_spec: dict):
+    """This function returns the (field, name) of every trace of a trace spec."""
+    if "count" not in trace_spec:
+        return [(trace_spec.get("field"), trace_spec["name"])]
+
+    return [
+        (trace_spec["field"].format(index=index), trace_spec["name"].format(number=index + 1))
+        for index in range(trace_spec["count"])
+    ]
+
+
+def get_subplot_layout(rows: list, vertical_spacing: float):
+    """This function returns the layout of make_subplots(rows, cols=1, shared_xaxes=True) with formatted y axes, one
+    legend per subplot and the x axis labels shown in every subplot."""
+    row_count = len(rows)
+    height = (1 - vertical_spacing * (row_count - 1)) / row_count
+
+    layout = {"annotations": [], "showlegend": True}
+    for row_num, row in enumerate(rows, 1):
+        suffix = "" if row_num == 1 else str(row_num)
+        bottom = (row_count - row_num) * (height + vertical_spacing)
+        domain = [bottom, bottom + height]
+
+        xaxis = {"anchor": f"y{suffix}", "domain": [0.0, 1.0], "showticklabels": True}
+        if row_num != row_count:
+            # zoom all subplots together with the bottom one
+            xaxis["matches"] = f"x{row_count}"
+
+        yaxis = {"anchor": f"x{suffix}", "domain": domain, "exponentformat": "none", "separatethousands": True}
+        if row.get("unit"):
+            yaxis["ticksuffix"] = row["unit"]
+
+        layout[f"xaxis{suffix}"] = xaxis
+        layout[f"yaxis{suffix}"] = yaxis
+        layout[f"legend{suffix}"] = {"y": domain[1], "yanchor": "top"}
+        layout["annotations"].append(
+            {
+                "font": {"size": 16},
+                "showarrow": False,
+                "text": row["title"],
+                "x": 0.5,
+                "xanchor": "center",
+                "xref": "paper",
+                "y": domain[1],
+                "yanchor": "bottom",
+                "yref": "paper",
+            }
+        )
+
+    return layout
+
+
+@span("render_figure")
+def render_figure(figure_spec: dict, df: pd.DataFrame, time_base: TimeBase, title: str):
+    """This function renders a figure spec (see above) with the data of a topic. All traces and the layout are
+    created at once, which is much faster than make_subplots and an add_trace call per trace."""
+    timestamps = df[figure_spec["timestamp_field"]]
+
+    traces = []
+    for row_num, row in enumerate(figure_spec["rows"], 1):
+        suffix = "" if row_num == 1 else str(row_num)
+
+        for trace_spec in row["traces"]:
+            properties = {key: value for key, value in trace_spec.items() if key not in trace_spec_keys}
+
+            for field, name in expand_trace_spec(trace_spec):
+                if trace_spec.get("optional") and field not in df.columns:
+                    continue
+
+                traces.append(
+                    get_scatter_properties(
+                        x=timestamps,
+                        y=get_trace_values(df, trace_spec, field),
+                        name=name,
+                        time_base=time_base,
+                        xaxis=f"x{suffix}",
+                        yaxis=f"y{suffix}",
+                        legend=f"legend{suffix}",
+                        **properties,
+                    )
+                )
+
+    layout = get_subplot_layout(figure_spec["rows"], figure_spec.get("vertical_spacing", default_vertical_spacing))
+    return go.Figure(data=traces, layout={**layout, "title": {"text": title}, "autosize": True})
@@ -0,0 +1,185 @@
+import logging
+import os
+import numpy as np
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+from plotly.subplots import make_subplots
+
+from modules import battery_status, esc_status, sensor_combined, trace_factory
+from modules.figure_formatter import format_figure, set_figure_height
+from modules.flight_events import get_event_timestamp
+from modules.spectral_analysis import accumulate_chunks
+from modules.topic_source import TopicSource
+
+figure_title = "Flight comparison"
+
+# the resampled grid of a signal has at most this many points
+max_grid_points = 200000
+
+# frequencies of the overlaid vibration spectra
+frequency_point_count = 1024
+
+
+def get_battery_voltage(topic_source: TopicSource):
+    data = topic_source.get_dataset(battery_status.message_name)
+    return data["timestamp"], data["voltage_v"]
+
+
+def get_battery_current(topic_source: TopicSource):
+    data = topic_source.get_dataset(battery_status.message_name)
+    return data["timestamp"], data["current_a"]
+
+
+def get_max_esc_temperature(topic_source: TopicSource):
+    data = topic_source.get_dataset(esc_status.message_name)
+    temperatures = np.stack([data[f"esc[{x}].esc_temperature"] for x in range(esc_status.motor_count)])
+    # ESC reports negative temperature when it's not armed, shown as absolute values like in the ESC tab
+    return data["timestamp"], np.max(np.abs(temperatures), axis=0)
+
+
+# time series overlaid in the comparison: {subplot title: (message name, function returning (timestamps, values))}
+comparison_signals = {
+    "Battery voltage (V)": (battery_status.message_name, get_battery_voltage),
+    "Battery current (A)": (battery_status.message_name, get_battery_current),
+    "Max. ESC temperature (°C)": (esc_status.message_name, get_max_esc_temperature),
+}
+
+
+def get_log_label(ulog_filename: str):
+    return os.path.splitext(os.path.basename(ulog_filename))[0]
+
+
+def get_alignment_timestamp(topic_source: TopicSource, event: str):
+    """This function returns the boot timestamp logs are aligned on, the start of the log if the event is missing."""
+    timestamp = get_event_timestamp(topic_source, event)
+    if timestamp is not None:
+        return timestamp
+
+    return topic_source.get_log_time_range()[0]
+
+
+def get_common_grid(series: list):
+    """This function returns a uniform grid (seconds) covering all series, with the finest median sample interval of
+    the series but at most max_grid_points points."""
+    start = min(x[0] for x, _ in series)
+    end = max(x[-1] for x, _ in series)
+
+    intervals = [np.median(np.diff(x)) for x, _ in series if len(x) > 1]
+    step = max(min(intervals, default=end - start), (end - start) / max_grid_points, 1e-6)
+
+    return np.arange(start, end + step / 2, step)
+
+
+def resample(series: list, grid: np.ndarray):
+    """This function interpolates all series onto the grid, outside of a series the values are NaN."""
+    return [np.interp(grid, x, y, left=np.nan, right=np.nan) for x, y in series]
+
+
+def get_vibration_spectrum(topic_source: TopicSource):
+    """This function returns the Welch PSD of the acceleration summed over the axes."""
+    message_name = sensor_combined.message_name
+    fields = sensor_combined.acceleration_fields
+    accumulator = accumulate_chunks(
+        topic_source.iter_chunks(message_name, 0, ["timestamp"] + fields),
+        "timestamp",
+        fields,
+        end_us=int(topic_source.get_dataset(message_name)["timestamp"][-1]),
+    )
+    frequencies, psd = accumulator.get_welch()
+    return frequencies, psd.sum(axis=0)
+
+
+def add_overlay_traces(fig: go.Figure, row: int, series: list, labels: list, colors: list, grid: np.ndarray = None):
+    """This function adds one trace per log to a subplot. The decimation budget of a subplot is shared by the logs,
+    so comparing more logs doesn't send more points to the browser."""
+    values = resample(series, grid) if grid is not None else [y for _, y in series]
+    point_count = trace_factory.target_point_count // max(len(series), 1)
+
+    for (x, _), y, label, color in zip(series, values, labels, colors):
+        x_plot, y_plot = trace_factory.decimate(grid if grid is not None else x, y, point_count)
+        scatter_type = go.Scattergl if len(y) > trace_factory.webgl_point_threshold else go.Scatter
+        fig.add_trace(
+            scatter_type(
+                x=x_plot,
+                y=y_plot,
+                mode="lines",
+                name=label,
+                legendgroup=label,
+                showlegend=row == 1,
+                line={"color": color},
+            ),
+            row=row,
+            col=1,
+        )
+
+
+def read_comparison_data(sessions: list, event: str):
+    """This function overlays the signals of several logs (LogSession objects), aligned on an event of each log and
+    resampled onto a common time grid."""
+    subplot_titles = list(comparison_signals.keys()) + ["Vibration (acceleration PSD)"]
+    rows = len(subplot_titles)
+
+    fig = make_subplots(
+        rows=rows,
+        cols=1,
+        vertical_spacing=0.05,
+        subplot_titles=subplot_titles,
+    )
+
+    labels = [get_log_label(session.ulog_filename) for session in sessions]
+    colors = [qualitative.Plotly[x % len(qualitative.Plotly)] for x in range(len(sessions))]
+    alignment_timestamps = [get_alignment_timestamp(session.topic_source, event) for session in sessions]
+
+    for row, (title, (message_name, get_signal)) in enumerate(comparison_signals.items(), 1):
+        series, row_labels, row_colors = [], [], []
+
+        for session, alignment_timestamp, label, color in zip(sessions, alignment_timestamps, labels, colors):
+            if session.topic_source.get_multi_id_num(message_name) == 0:
+                logging.info(f"{label} has no {message_name}")
+                continue
+
+            timestamps, values = get_signal(session.topic_source)
+            if len(timestamps) == 0:
+                continue
+
+            # seconds relative to the event
+            series.append(((np.asarray(timestamps, dtype=np.int64) - alignment_timestamp) / 1e6, np.asarray(values)))
+            row_labels.append(label)
+            row_colors.append(color)
+
+        if len(series) > 0:
+            add_overlay_traces(fig, row, series, row_labels, row_colors, get_common_grid(series))
+
+    # vibration spectra are interpolated onto a common frequency axis
+    spectra, spectrum_labels, spectrum_colors = [], [], []
+    for session, label, color in zip(sessions, labels, colors):
+        if (
+            session.topic_source.get_multi_id_num(sensor_combined.message_name) == 0
+            or session.topic_source.get_sample_count(sensor_combined.message_name) == 0
+        ):
+            continue
+
+        frequencies, psd = get_vibration_spectrum(session.topic_source)
+        if len(frequencies) > 0:
+            spectra.append((frequencies, psd))
+            spectrum_labels.append(label)
+            spectrum_colors.append(color)
+
+    if len(spectra) > 0:
+        max_frequency = max(frequencies[-1] for frequencies, _ in spectra)
+        frequency_grid = np.linspace(0, max_frequency, frequency_point_count)
+        add_overlay_traces(fig, rows, spectra, spectrum_labels, spectrum_colors, frequency_grid)
+
+    format_figure(fig)
+
+    # one legend for all subplots, the traces of a log share a color
+    fig.update_layout(title_text=f"{figure_title} (aligned on {event})", showlegend=True)
+    fig.update_traces(legend="legend")
+    for row in range(1, rows):
+        fig.update_xaxes(title_text=f"Time since {event} (s)", row=row, col=1)
+    fig.update_xaxes(title_text="Frequency (Hz)", row=rows, col=1)
+    fig.update_yaxes(type="log", row=rows, col=1)
+
+    set_figure_height(fig)
+
+    return fig
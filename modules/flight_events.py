@@ -0,0 +1,54 @@
+import logging
+import numpy as np
+
+from modules.topic_source import TopicSource
+
+# topics of the events logs can be aligned on
+required_topics = {
+    "vehicle_status": ["timestamp", "arming_state"],
+    "vehicle_land_detected": ["timestamp", "landed"],
+    "vehicle_gps_position": ["timestamp", "fix_type"],
+}
+
+alignment_events = ["arming", "takeoff", "first GPS fix"]
+
+# vehicle_status.arming_state
+arming_state_armed = 2
+
+# vehicle_gps_position.fix_type
+fix_type_3d = 3
+
+
+def get_first_timestamp(topic_source: TopicSource, message_name: str, field: str, condition):
+    """This function returns the first timestamp of a topic for which condition(field) is true (None if there is no
+    such sample)."""
+    if topic_source.get_multi_id_num(message_name) == 0:
+        return None
+
+    data = topic_source.get_dataset(message_name)
+    if field not in data:
+        return None
+
+    indices = np.flatnonzero(condition(data[field]))
+    return int(data["timestamp"][indices[0]]) if len(indices) > 0 else None
+
+
+def get_event_timestamp(topic_source: TopicSource, event: str):
+    """This function returns the boot timestamp of an alignment event of the log, None if it didn't happen."""
+    if event == "arming":
+        timestamp = get_first_timestamp(
+            topic_source, "vehicle_status", "arming_state", lambda state: state == arming_state_armed
+        )
+    elif event == "takeoff":
+        timestamp = get_first_timestamp(topic_source, "vehicle_land_detected", "landed", lambda landed: landed == 0)
+    elif event == "first GPS fix":
+        timestamp = get_first_timestamp(
+            topic_source, "vehicle_gps_position", "fix_type", lambda fix_type: fix_type >= fix_type_3d
+        )
+    else:
+        raise Exception(f"Unknown event {event}")
+
+    if timestamp is None:
+        logging.warning(f"No {event} found")
+
+    return timestamp
@@ -0,0 +1,141 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# only the most recent spans are kept for the load diagnostics and the --profile trace
+max_span_count = 100000
+
+# completed spans, oldest first: {name, category, start_us, duration_us, pid, tid, thread, depth, args, memory deltas}
+spans = deque(maxlen=max_span_count)
+
+# the args of the enclosing span (e.g. the log) are inherited by the nested spans, also in the threads which run
+# in a copy of the context (see run_reader_jobs)
+span_context = contextvars.ContextVar("span_context", default=({}, 0))
+
+
+def get_rss_bytes():
+    """This function returns the resident memory of the process, None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def record_span(
+    name: str, category: str, start_time: float, rss_before: int = None, traced_before: int = None, **args
+):
+    """This function records a span which started at start_time (time.perf_counter()) and ends now."""
+    duration = time.perf_counter() - start_time
+    inherited_args, depth = span_context.get()
+
+    record = {
+        "name": name,
+        "category": category,
+        # perf_counter is monotonic system-wide on Linux, so spans of worker processes line up
+        "start_us": int(start_time * 1e6),
+        "duration_us": int(duration * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "thread": threading.current_thread().name,
+        "depth": depth,
+        "args": {**inherited_args, **args},
+    }
+
+    rss_after = get_rss_bytes()
+    if rss_before is not None and rss_after is not None:
+        record["rss_delta_bytes"] = rss_after - rss_before
+    if traced_before is not None and tracemalloc.is_tracing():
+        record["traced_delta_bytes"] = tracemalloc.get_traced_memory()[0] - traced_before
+
+    spans.append(record)
+
+    memory = f", RSS {record['rss_delta_bytes'] / 1024 / 1024:+.1f} MB" if "rss_delta_bytes" in record else ""
+    logging.debug(f"{'  ' * depth}{name}: {duration * 1000:.1f} ms{memory}")
+
+
+@contextmanager
+def span(name: str, category: str = "stage", **args):
+    """Times the enclosed block together with the change of the resident (and, with --profile, the Python heap)
+    memory. Usage: with span("decode topics", log=ulog_filename): ..."""
+    inherited_args, depth = span_context.get()
+    token = span_context.set(({**inherited_args, **args}, depth + 1))
+
+    rss_before = get_rss_bytes()
+    traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_context.reset(token)
+        record_span(name, category, start_time, rss_before, traced_before, **args)
+
+
+def pop_spans():
+    """This function returns and removes the recorded spans, e.g. to pass the spans of a worker process to the main
+    process."""
+    popped_spans = list(spans)
+    spans.clear()
+    return popped_spans
+
+
+def add_spans(worker_spans: list):
+    """This function adds the spans of a worker process, nested into the current span."""
+    inherited_args, depth = span_context.get()
+    for record in worker_spans:
+        spans.append({**record, "depth": record["depth"] + depth, "args": {**inherited_args, **record["args"]}})
+
+
+def get_spans(ulog_filename: str):
+    return [record for record in list(spans) if record["args"].get("log") == ulog_filename]
+
+
+def get_trace(trace_spans: list):
+    """This function converts spans into the Chrome trace event format, which chrome://tracing, Perfetto and
+    speedscope open."""
+    events = [
+        {
+            "name": record["name"],
+            "cat": record["category"],
+            "ph": "X",
+            "ts": record["start_us"],
+            "dur": record["duration_us"],
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": {
+                **record["args"],
+                **{key: record[key] for key in ["rss_delta_bytes", "traced_delta_bytes"] if key in record},
+            },
+        }
+        for record in trace_spans
+    ]
+
+    # name the threads in the viewer
+    threads = {(record["pid"], record["tid"]): record["thread"] for record in trace_spans}
+    events.extend(
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+        for (pid, tid), thread in threads.items()
+    )
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_trace(trace_filename: str):
+    with open(trace_filename, "w") as file:
+        json.dump(get_trace(list(spans)), file, default=str)
+
+    logging.info(f"Wrote {len(spans)} spans to {trace_filename}")
+
+
+def enable_profiling(trace_filename: str):
+    """This function additionally traces the Python heap (slower) and writes all spans to trace_filename when the
+    program exits."""
+    tracemalloc.start()
+    atexit.register(write_trace, trace_filename)
@@ -0,0 +1,330 @@
+import logging
+import os
+import re
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from modules.batch_processor import find_ulog_files
+from modules.timestamp_helper import get_time_base
+from modules.topic_cache import default_cache_size_mb
+from modules.topic_source import TopicSource, get_reader_module, get_required_fields, load_log
+
+# bump this whenever the schema or the statistics change, older catalogs are rebuilt then
+catalog_version = 1
+
+percentiles = [5, 50, 95]
+
+# statistics which can be queried, with the column of the timestamp of the value
+query_stats = {
+    "count": None,
+    "min": "min_timestamp",
+    "max": "max_timestamp",
+    "mean": None,
+    "p5": None,
+    "p50": None,
+    "p95": None,
+    "counter_delta": None,
+    "seconds_above": None,
+}
+
+query_operators = [">=", "<=", "!=", "=", ">", "<"]
+
+# e.g. "esc_status.esc[*].esc_temperature max > 90", * matches any part of the field name
+query_pattern = re.compile(
+    r"(?P<message_name>[^.\s]+)\.(?P<field>\S+)\s+(?P<stat>"
+    + "|".join(query_stats)
+    + r")\s*(?P<operator>"
+    + "|".join(re.escape(operator) for operator in query_operators)
+    + r")\s*(?P<value>\S+)"
+)
+
+default_query_limit = 100
+
+schema = """
+CREATE TABLE IF NOT EXISTS catalog_info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS logs (
+    log_id INTEGER PRIMARY KEY,
+    ulog_filename TEXT UNIQUE,
+    size INTEGER,
+    mtime_ns INTEGER,
+    boot_to_local_offset_us INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS field_stats (
+    log_id INTEGER REFERENCES logs ON DELETE CASCADE,
+    message_name TEXT,
+    multi_id INTEGER,
+    field TEXT,
+    count INTEGER,
+    min REAL,
+    min_timestamp INTEGER,
+    max REAL,
+    max_timestamp INTEGER,
+    mean REAL,
+    p5 REAL,
+    p50 REAL,
+    p95 REAL,
+    counter_delta REAL,
+    threshold REAL,
+    seconds_above REAL
+);
+CREATE INDEX IF NOT EXISTS field_stats_field ON field_stats (message_name, field);
+"""
+
+
+def get_module_declarations(readers: list, name: str):
+    """This function collects an optional declaration of the reader modules per topic: {message_name: value}.
+    Modules declare catalog_thresholds = {field: threshold} and counter_fields = [field, ...]."""
+    declarations = {}
+    for reader in readers:
+        module = get_reader_module(reader)
+        if hasattr(module, name):
+            declarations[module.message_name] = getattr(module, name)
+
+    return declarations
+
+
+def get_column_stats(timestamps: np.ndarray, values: np.ndarray, threshold: float = None, is_counter: bool = False):
+    """This function aggregates a single field. NaNs are ignored, the timestamps of the extremes are boot
+    timestamps."""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    stats = {"count": int(np.count_nonzero(valid))}
+    if stats["count"] == 0:
+        return stats
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    valid_values = values[valid]
+    valid_timestamps = timestamps[valid]
+
+    min_index = int(np.argmin(valid_values))
+    max_index = int(np.argmax(valid_values))
+    stats.update(
+        {
+            "min": float(valid_values[min_index]),
+            "min_timestamp": int(valid_timestamps[min_index]),
+            "max": float(valid_values[max_index]),
+            "max_timestamp": int(valid_timestamps[max_index]),
+            "mean": float(np.mean(valid_values)),
+        }
+    )
+    stats.update({f"p{q}": float(value) for q, value in zip(percentiles, np.percentile(valid_values, percentiles))})
+
+    if is_counter:
+        # only increments are summed, so counters which restart (e.g. a rebooted ESC) don't give negative deltas
+        stats["counter_delta"] = float(np.sum(np.maximum(np.diff(valid_values), 0)))
+
+    if threshold is not None:
+        # every sample holds its value until the next sample
+        intervals_us = np.diff(valid_timestamps)
+        stats["threshold"] = float(threshold)
+        stats["seconds_above"] = float(np.sum(intervals_us[valid_values[:-1] > threshold]) / 1e6)
+
+    return stats
+
+
+def get_field_stats(topic_source: TopicSource, required_fields: dict, thresholds: dict, counter_fields: dict):
+    """This function returns the statistics of all required fields of all data sets of a log."""
+    field_stats = []
+
+    for (message_name, multi_id), data in topic_source.datasets.items():
+        if message_name not in required_fields or "timestamp" not in data:
+            continue
+
+        for field in required_fields[message_name]:
+            if field == "timestamp" or field not in data:
+                continue
+
+            stats = get_column_stats(
+                data["timestamp"],
+                data[field],
+                thresholds.get(message_name, {}).get(field),
+                field in counter_fields.get(message_name, []),
+            )
+            field_stats.append({"message_name": message_name, "multi_id": multi_id, "field": field, **stats})
+
+    return field_stats
+
+
+def index_log(
+    ulog_filename: str,
+    readers: list,
+    use_cache: bool = True,
+    cache_dir: str = None,
+    cache_size_mb: int = default_cache_size_mb,
+):
+    """This function computes the catalog entry of a single log from the topics the readers use. It doesn't raise,
+    errors are reported in the returned entry."""
+    entry = {"ulog_filename": ulog_filename, "field_stats": [], "boot_to_local_offset_us": None}
+
+    try:
+        topic_source, time_base, _ = load_log(ulog_filename, readers, use_cache, cache_dir, cache_size_mb)
+
+        entry["boot_to_local_offset_us"] = time_base.boot_to_local_offset_us
+        entry["field_stats"] = get_field_stats(
+            topic_source,
+            get_required_fields(readers + [get_time_base]),
+            get_module_declarations(readers, "catalog_thresholds"),
+            get_module_declarations(readers, "counter_fields"),
+        )
+    except Exception:
+        entry["error"] = traceback.format_exc()
+
+    return entry
+
+
+def open_catalog(catalog_filename: str):
+    """This function opens the catalog and creates (or recreates an outdated) schema."""
+    connection = sqlite3.connect(catalog_filename)
+    connection.execute("PRAGMA foreign_keys = ON")
+
+    version = None
+    if connection.execute("SELECT name FROM sqlite_master WHERE name = 'catalog_info'").fetchone() is not None:
+        row = connection.execute("SELECT value FROM catalog_info WHERE key = 'version'").fetchone()
+        version = int(row[0]) if row is not None else None
+
+    if version != catalog_version:
+        if version is not None:
+            logging.info(f"Rebuilding catalog {catalog_filename} (version {version} != {catalog_version})")
+        connection.executescript(
+            "DROP TABLE IF EXISTS field_stats; DROP TABLE IF EXISTS logs; DROP TABLE IF EXISTS catalog_info;"
+        )
+        connection.executescript(schema)
+        connection.execute("INSERT INTO catalog_info VALUES ('version', ?)", (str(catalog_version),))
+        connection.commit()
+
+    return connection
+
+
+def write_entry(connection: sqlite3.Connection, entry: dict, stat: os.stat_result):
+    connection.execute("DELETE FROM logs WHERE ulog_filename = ?", (entry["ulog_filename"],))
+    log_id = connection.execute(
+        "INSERT INTO logs (ulog_filename, size, mtime_ns, boot_to_local_offset_us, error) VALUES (?, ?, ?, ?, ?)",
+        (entry["ulog_filename"], stat.st_size, stat.st_mtime_ns, entry["boot_to_local_offset_us"], entry.get("error")),
+    ).lastrowid
+
+    columns = ["message_name", "multi_id", "field", "count", "min", "min_timestamp", "max", "max_timestamp", "mean"]
+    columns += [f"p{q}" for q in percentiles] + ["counter_delta", "threshold", "seconds_above"]
+    connection.executemany(
+        f"INSERT INTO field_stats (log_id, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+        [(log_id, *[stats.get(column) for column in columns]) for stats in entry["field_stats"]],
+    )
+    connection.commit()
+
+
+def update_catalog(catalog_filename: str, input_dirname: str, readers: list, workers: int = None, **kwargs):
+    """This function indexes the new and changed logs of input_dirname in a process pool and removes the logs
+    which don't exist anymore. Returns the number of failed logs."""
+    ulog_filenames = [os.path.abspath(name) for name in find_ulog_files(input_dirname)]
+    stats = {ulog_filename: os.stat(ulog_filename) for ulog_filename in ulog_filenames}
+
+    connection = open_catalog(catalog_filename)
+    cataloged_filenames = [ulog_filename for (ulog_filename,) in connection.execute("SELECT ulog_filename FROM logs")]
+    # logs which failed are indexed again on every run until they succeed
+    indexed = {
+        ulog_filename: (size, mtime_ns)
+        for ulog_filename, size, mtime_ns in connection.execute(
+            "SELECT ulog_filename, size, mtime_ns FROM logs WHERE error IS NULL"
+        )
+    }
+
+    # the catalog can contain logs of other directories
+    input_dirname = os.path.abspath(input_dirname)
+    removed_filenames = [
+        name
+        for name in cataloged_filenames
+        if name not in stats and os.path.commonpath([name, input_dirname]) == input_dirname
+    ]
+    connection.executemany("DELETE FROM logs WHERE ulog_filename = ?", [(name,) for name in removed_filenames])
+    connection.commit()
+
+    # logs are only indexed again if they changed
+    pending_filenames = [
+        ulog_filename
+        for ulog_filename in ulog_filenames
+        if indexed.get(ulog_filename) != (stats[ulog_filename].st_size, stats[ulog_filename].st_mtime_ns)
+    ]
+    logging.info(
+        f"Found {len(ulog_filenames)} ulog files in {input_dirname}: {len(pending_filenames)} to index, "
+        f"{len(removed_filenames)} removed"
+    )
+
+    start_time = time.perf_counter()
+    failed_count = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(index_log, ulog_filename, readers, **kwargs): ulog_filename
+            for ulog_filename in pending_filenames
+        }
+
+        # the catalog is only written by this process
+        for future in as_completed(futures):
+            ulog_filename = futures[future]
+            try:
+                entry = future.result()
+            except Exception:
+                # e.g. a worker process that got killed
+                entry = {"ulog_filename": ulog_filename, "field_stats": [], "boot_to_local_offset_us": None}
+                entry["error"] = traceback.format_exc()
+
+            write_entry(connection, entry, stats[ulog_filename])
+
+            if "error" in entry:
+                failed_count += 1
+                logging.error(f"{ulog_filename} failed:")
+                logging.error(entry["error"])
+
+    connection.close()
+
+    logging.info(
+        f"Indexed {len(pending_filenames)} logs in {time.perf_counter() - start_time:.1f} s, {failed_count} failed"
+    )
+    return failed_count
+
+
+def to_like_pattern(field: str):
+    """This function converts a field pattern with * wildcards to a LIKE pattern."""
+    escaped = field.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%")
+
+
+def query_catalog(catalog_filename: str, query: str, limit: int = default_query_limit):
+    """This function returns the fields of all logs matching a query like "esc_status.esc[*].esc_temperature max > 90"
+    as dicts, the most extreme values first. The time of the extreme is given for min and max queries."""
+    match = query_pattern.fullmatch(query.strip())
+    if match is None:
+        raise ValueError(f"Invalid query {query}, expected e.g. 'esc_status.esc[*].esc_temperature max > 90'")
+
+    stat = match["stat"]
+    timestamp_column = query_stats[stat] or "NULL"
+    order = "ASC" if match["operator"].startswith("<") else "DESC"
+
+    connection = open_catalog(catalog_filename)
+    rows = connection.execute(
+        f"SELECT logs.ulog_filename, message_name, multi_id, field, {stat}, {timestamp_column}, "
+        f"boot_to_local_offset_us FROM field_stats JOIN logs USING (log_id) "
+        f"WHERE message_name = ? AND field LIKE ? ESCAPE '\\' AND {stat} {match['operator']} ? "
+        f"ORDER BY {stat} {order} LIMIT ?",
+        (match["message_name"], to_like_pattern(match["field"]), float(match["value"]), limit),
+    ).fetchall()
+    connection.close()
+
+    results = []
+    for ulog_filename, message_name, multi_id, field, value, timestamp, boot_to_local_offset_us in rows:
+        result = {
+            "ulog_filename": ulog_filename,
+            "message_name": message_name,
+            "multi_id": multi_id,
+            "field": field,
+            stat: value,
+            "timestamp": timestamp,
+        }
+        if timestamp is not None and boot_to_local_offset_us is not None:
+            result["local_time"] = str(np.datetime64(timestamp + boot_to_local_offset_us, "us"))
+        results.append(result)
+
+    return results
@@ -0,0 +1,270 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from modules import trace_factory
+from modules.figure_json import get_etag, serialize_figure
+from modules.instrumentation import span
+from modules.reader_executor import build_figure, get_reader_jobs, run_reader_jobs
+from modules.table_pager import get_table_data
+from modules.timestamp_helper import TimeBase
+from modules.topic_cache import default_cache_size_mb
+from modules.topic_source import TopicSource, get_reader_module, load_log
+
+# built figures are cached per log, this limits how many of them are kept in memory
+default_max_figures = 8
+
+# the raw data tables (every page, sort and filter request reads the whole table) are cached per log as well
+default_max_tables = 4
+
+# the least recently used logs are evicted if all loaded logs use more memory than this
+default_max_memory_mb = 2048
+
+
+def sanitize_fig_title(title: str):
+    return title.lower().replace(" ", "-")
+
+
+class LogSession:
+    """Decoded topics, time base and built figures of a single log."""
+
+    def __init__(
+        self,
+        ulog_filename: str,
+        topic_source: TopicSource,
+        time_base: TimeBase,
+        readers: list,
+        max_figures: int = default_max_figures,
+        max_tables: int = default_max_tables,
+    ):
+        self.ulog_filename = ulog_filename
+        self.topic_source = topic_source
+        self.time_base = time_base
+        self.max_figures = max_figures
+        self.max_tables = max_tables
+
+        # one tab per reader and data set: {sanitized_fig_title: (reader, dataset_num)}, {sanitized_fig_title: title}
+        self.tab_readers = {}
+        self.tab_titles = {}
+        for title, reader, dataset_num in get_reader_jobs(readers, topic_source):
+            self.tab_readers[sanitize_fig_title(title)] = (reader, dataset_num)
+            self.tab_titles[sanitize_fig_title(title)] = title
+
+        # the figures are shared by the threads of the --serve mode
+        self.figures = OrderedDict()
+        self.figures_lock = threading.Lock()
+
+        # serialized figures sent to the browser: {tab: (json bytes, etag)}, evicted together with the figures
+        self.figure_jsons = {}
+
+        # raw data tables of the tabs with a table, the least recently used are evicted: {tab: DataFrame}
+        self.tables = OrderedDict()
+
+    def add_figure(self, tab: str, fig):
+        # remove figure title because the tab name already contains it
+        fig.layout.title.text = ""
+
+        with self.figures_lock:
+            self.figures[tab] = fig
+            self.figure_jsons.pop(tab, None)
+            while len(self.figures) > self.max_figures:
+                evicted_tab, evicted_fig = self.figures.popitem(last=False)
+                self.figure_jsons.pop(evicted_tab, None)
+                trace_factory.release_figure(evicted_fig)
+
+    def get_figure(self, tab: str):
+        """This function returns the figure of a tab, only the most recently used figures are kept."""
+        with self.figures_lock:
+            if tab in self.figures:
+                self.figures.move_to_end(tab)
+                return self.figures[tab]
+
+        # built outside of the lock, so other tabs can be opened meanwhile
+        reader, dataset_num = self.tab_readers[tab]
+        with span("build figure", log=self.ulog_filename, tab=tab):
+            fig = build_figure(reader, self.topic_source, self.time_base, dataset_num)
+        self.add_figure(tab, fig)
+
+        return fig
+
+    def get_figure_json(self, tab: str):
+        """This function returns the figure of a tab serialized to JSON and its ETag. Every figure is only serialized
+        once, switching back to a tab sends the same bytes (or nothing if the browser still has them)."""
+        fig = self.get_figure(tab)
+
+        with self.figures_lock:
+            if tab in self.figure_jsons:
+                return self.figure_jsons[tab]
+
+        with span("serialize figure", log=self.ulog_filename, tab=tab):
+            figure_json = serialize_figure(fig)
+            etag = get_etag(figure_json)
+
+        with self.figures_lock:
+            # the figure may have been evicted meanwhile
+            if self.figures.get(tab) is fig:
+                self.figure_jsons[tab] = (figure_json, etag)
+
+        return figure_json, etag
+
+    def prebuild_figures(self, mode: str, workers: int = None):
+        """This function builds the figures of the first tabs concurrently, as many as the figure cache keeps."""
+        tabs = list(self.tab_readers.keys())[: self.max_figures]
+        jobs = [(tab, *self.tab_readers[tab]) for tab in tabs]
+
+        with span("prebuild figures", log=self.ulog_filename):
+            figures = run_reader_jobs(jobs, self.topic_source, self.time_base, mode, workers)
+
+        for tab, fig in zip(tabs, figures):
+            self.add_figure(tab, fig)
+            self.get_figure_json(tab)
+
+    def get_table_columns(self, tab: str):
+        """Modules with a raw data table declare its columns in table_columns."""
+        reader, _ = self.tab_readers[tab]
+        return getattr(get_reader_module(reader), "table_columns", None)
+
+    def get_table(self, tab: str):
+        """This function returns the raw data table of a tab, which is only prepared once (timestamps converted to
+        local time). The pages are sliced from the cached table, sorting and filtering return new frames."""
+        with self.figures_lock:
+            if tab in self.tables:
+                self.tables.move_to_end(tab)
+                return self.tables[tab]
+
+        # prepared outside of the lock like the figures
+        reader, dataset_num = self.tab_readers[tab]
+        with span("prepare table", log=self.ulog_filename, tab=tab):
+            table = get_table_data(
+                self.topic_source,
+                self.time_base,
+                get_reader_module(reader).message_name,
+                dataset_num,
+                self.get_table_columns(tab),
+            )
+
+        with self.figures_lock:
+            self.tables[tab] = table
+            while len(self.tables) > self.max_tables:
+                self.tables.popitem(last=False)
+
+        return table
+
+    def get_memory_size(self):
+        """This function estimates the memory used by the log in bytes: decoded topics which aren't memory mapped,
+        the full resolution data of the built figures, the serialized figures and the raw data tables."""
+        arrays = [column for data in self.topic_source.datasets.values() for column in data.values()]
+
+        with self.figures_lock:
+            size = sum(len(figure_json) for figure_json, _ in self.figure_jsons.values())
+            size += sum(int(table.memory_usage(index=True).sum()) for table in self.tables.values())
+            for fig in self.figures.values():
+                for trace in fig.data:
+                    if trace.uid in trace_factory.full_resolution_traces:
+                        arrays.extend(trace_factory.full_resolution_traces[trace.uid][:2])
+
+        # the traces mostly are views of the decoded topics, every buffer is only counted once
+        buffers = {}
+        for array in arrays:
+            while isinstance(array.base, np.ndarray):
+                array = array.base
+            if not isinstance(array, np.memmap):
+                buffers[id(array)] = array.nbytes
+
+        return size + sum(buffers.values())
+
+    def release(self):
+        with self.figures_lock:
+            for fig in self.figures.values():
+                trace_factory.release_figure(fig)
+            self.figures.clear()
+            self.figure_jsons.clear()
+            self.tables.clear()
+
+
+class LogSessions:
+    """Loaded logs keyed by their file name. Whole logs are evicted (least recently used first) if they use more
+    memory than max_memory_mb, so switching back to a recently viewed log doesn't load it again."""
+
+    def __init__(
+        self,
+        readers: list,
+        max_memory_mb: int = default_max_memory_mb,
+        max_figures: int = default_max_figures,
+        use_cache: bool = True,
+        cache_dir: str = None,
+        cache_size_mb: int = default_cache_size_mb,
+        export_dirname: str = None,
+        start: str = None,
+        end: str = None,
+    ):
+        self.readers = readers
+        self.max_memory_mb = max_memory_mb
+        self.max_figures = max_figures
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_size_mb = cache_size_mb
+        # the topics of every loaded log are exported as csv files into this directory
+        self.export_dirname = export_dirname
+        # only this time range of the logs is loaded (see load_time_range)
+        self.start = start
+        self.end = end
+
+        self.sessions = OrderedDict()
+        self.sessions_lock = threading.Lock()
+        # one lock per log, concurrent requests of a log which isn't loaded yet wait for one load: {filename: lock}
+        self.load_locks = {}
+
+    def load(self, ulog_filename: str):
+        topic_source, time_base, _ = load_log(
+            ulog_filename, self.readers, self.use_cache, self.cache_dir, self.cache_size_mb, self.start, self.end
+        )
+
+        if self.export_dirname is not None:
+            topic_source.export_topics(self.export_dirname, ulog_filename, "csv")
+
+        return LogSession(ulog_filename, topic_source, time_base, self.readers, self.max_figures)
+
+    def get(self, ulog_filename: str):
+        """This function returns the session of a log and loads the log if it isn't loaded yet."""
+        with self.sessions_lock:
+            session = self.sessions.get(ulog_filename)
+            if session is not None:
+                self.sessions.move_to_end(ulog_filename)
+
+        if session is None:
+            with self.sessions_lock:
+                load_lock = self.load_locks.setdefault(ulog_filename, threading.Lock())
+
+            # loaded outside of the sessions lock, so the other logs can be used meanwhile
+            with load_lock:
+                with self.sessions_lock:
+                    session = self.sessions.get(ulog_filename)
+
+                if session is None:
+                    logging.info(f"Loading {ulog_filename}")
+                    with span("load log", log=ulog_filename):
+                        session = self.load(ulog_filename)
+
+                with self.sessions_lock:
+                    self.sessions[ulog_filename] = session
+                    self.sessions.move_to_end(ulog_filename)
+
+        self.evict(keep_filename=ulog_filename)
+        return session
+
+    def evict(self, keep_filename: str = None):
+        with self.sessions_lock:
+            sizes = {ulog_filename: session.get_memory_size() for ulog_filename, session in self.sessions.items()}
+            total_size = sum(sizes.values())
+
+            for ulog_filename in list(self.sessions.keys()):
+                if total_size <= self.max_memory_mb * 1024 * 1024:
+                    break
+                if ulog_filename == keep_filename:
+                    continue
+
+                logging.info(f"Evicting {ulog_filename} ({sizes[ulog_filename] / 1024 / 1024:.0f} MB)")
+                self.sessions.pop(ulog_filename).release()
+                total_size -= sizes[ulog_filename]
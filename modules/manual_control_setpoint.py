@@ -1,97 +1,34 @@
-import logging
-import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
+from modules.figure_spec import render_figure
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
 
-from modules.csv_reader import get_csv_file, get_multi_id_num
-from modules.figure_formatter import format_figure
-from modules.timestamp_helper import fix_timestamps
+message_name = "manual_control_setpoint"
 
+figure_title = "Manual RC control setpoint"
 
-def read_manual_control_setpoint_data(tmp_dirname: str, ulog_filename: str):
-    message_name = "manual_control_setpoint"
+required_fields = ["timestamp_sample", "roll", "pitch", "yaw", "throttle"]
 
-    dataset_count = get_multi_id_num(tmp_dirname, message_name)
-    logging.info(f"Found {dataset_count} {message_name} data sets")
 
-    timestamp_field = "timestamp_sample"
+# subplots of the figure, see modules/figure_spec.py
+figure_spec = {
+    "timestamp_field": "timestamp_sample",
+    "rows": [
+        {
+            "title": "Controls",
+            "unit": " %",
+            "traces": [
+                {"field": "roll", "name": "Roll", "scale": 100},
+                {"field": "pitch", "name": "Pitch", "scale": 100},
+                {"field": "yaw", "name": "Yaw", "scale": 100},
+                {"field": "throttle", "name": "Throttle", "scale": 100},
+            ],
+        },
+    ],
+}
 
-    figs = []
 
-    for dataset_num in range(dataset_count):
-        # read in csv
-        df = pd.read_csv(get_csv_file(tmp_dirname, ulog_filename, message_name, dataset_num))
-        fix_timestamps(df, timestamp_field)
+def read_manual_control_setpoint_data(topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    # read in topic data
+    df = topic_source.get_data_frame(message_name, dataset_num)
 
-        rows = 1
-        subplot_titles = [
-            "Controls",
-        ]
-        if len(subplot_titles) != rows:
-            raise Exception("Number of subplots is wrong")
-
-        fig = make_subplots(
-            rows=rows,
-            cols=1,
-            vertical_spacing=0.02,
-            shared_xaxes=True,
-            subplot_titles=subplot_titles,
-        )
-
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"roll"] * 100,
-                mode="lines",
-                name=f"Roll",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"pitch"] * 100,
-                mode="lines",
-                name=f"Pitch",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"yaw"] * 100,
-                mode="lines",
-                name=f"Yaw",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"throttle"] * 100,
-                mode="lines",
-                name=f"Throttle",
-            ),
-        )
-
-        format_figure(fig)
-
-        # show x axis labels in every subplot
-        fig.update_layout(
-            title_text=f"Manual RC control setpoint {dataset_num}",
-            autosize=True,
-            xaxis_showticklabels=True,
-            yaxis={"ticksuffix": " %"},
-        )
-
-        figs.append(fig)
-
-    return figs
+    return render_figure(figure_spec, df, time_base, f"{figure_title} {dataset_num}")
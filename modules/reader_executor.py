@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextvars
+from contextlib import nullcontext
+
+from modules import trace_factory
+from modules.figure_formatter import set_figure_height
+from modules.instrumentation import add_spans, pop_spans, span
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource, get_reader_module
+
+# auto: every module runs in the executor it declares (executor_type = "thread" | "process", default thread)
+executor_modes = ["auto", "thread", "process", "serial"]
+
+default_executor_type = "thread"
+
+
+def get_reader_jobs(readers: list, topic_source: TopicSource):
+    """This function returns one job per reader and data set: [(title, reader, dataset_num)], in the order of
+    the readers."""
+    jobs = []
+
+    for reader in readers:
+        module = get_reader_module(reader)
+
+        dataset_count = topic_source.get_multi_id_num(module.message_name)
+        logging.info(f"Found {dataset_count} {module.message_name} data sets")
+
+        for dataset_num in range(dataset_count):
+            # e.g. no samples in the --start/--end time range
+            if topic_source.get_sample_count(module.message_name, dataset_num) == 0:
+                logging.info(f"Skipping {module.message_name} {dataset_num} without samples")
+                continue
+
+            jobs.append((f"{module.figure_title} {dataset_num}", reader, dataset_num))
+
+    return jobs
+
+
+def get_executor_type(reader, mode: str):
+    if mode != "auto":
+        return mode
+
+    return getattr(get_reader_module(reader), "executor_type", default_executor_type)
+
+
+def build_figure(reader, topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    with span(f"{reader.__name__} {dataset_num}", "module"):
+        fig = reader(topic_source, time_base, dataset_num)
+        set_figure_height(fig)
+    return fig
+
+
+def build_figure_in_process(reader, topic_source: TopicSource, time_base: TimeBase, dataset_num: int, max_points: int):
+    """Runs in a worker process, the full resolution data of the traces and the spans are returned together with the
+    figure."""
+    trace_factory.target_point_count = max_points
+    # a forked worker starts with a copy of the spans of the main process
+    pop_spans()
+
+    fig = build_figure(reader, topic_source, time_base, dataset_num)
+    return fig, trace_factory.pop_full_resolution_traces(fig), pop_spans()
+
+
+def run_reader_jobs(
+    jobs: list, topic_source: TopicSource, time_base: TimeBase, mode: str = "auto", workers: int = None
+):
+    """This function builds the figures of the given jobs concurrently. Thread jobs share the topics of this
+    process, process jobs only get the topic they read. Returns the figures in the order of the jobs."""
+    if mode not in executor_modes:
+        raise Exception(f"Unknown executor mode {mode}")
+
+    start_time = time.perf_counter()
+    figures = [None] * len(jobs)
+
+    if mode == "serial":
+        for index, (_, reader, dataset_num) in enumerate(jobs):
+            figures[index] = build_figure(reader, topic_source, time_base, dataset_num)
+        return figures
+
+    workers = workers or os.cpu_count()
+    executor_types = [get_executor_type(reader, mode) for _, reader, _ in jobs]
+    process_jobs = [index for index, executor_type in enumerate(executor_types) if executor_type == "process"]
+    thread_jobs = [index for index, executor_type in enumerate(executor_types) if executor_type != "process"]
+
+    process_pool = ProcessPoolExecutor(max_workers=min(workers, len(process_jobs))) if process_jobs else nullcontext()
+    with process_pool as processes:
+        # start the (usually slower) process jobs first so they overlap with the thread jobs
+        process_futures = {}
+        for index in process_jobs:
+            _, reader, dataset_num = jobs[index]
+            topics = topic_source.select([get_reader_module(reader).message_name])
+
+            process_futures[index] = processes.submit(
+                build_figure_in_process, reader, topics, time_base, dataset_num, trace_factory.target_point_count
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            # the spans of the threads are nested into the current span
+            thread_futures = {
+                index: threads.submit(
+                    contextvars.copy_context().run,
+                    build_figure,
+                    jobs[index][1],
+                    topic_source,
+                    time_base,
+                    jobs[index][2],
+                )
+                for index in thread_jobs
+            }
+
+            for index, future in thread_futures.items():
+                figures[index] = future.result()
+
+        for index, future in process_futures.items():
+            figures[index], traces, worker_spans = future.result()
+            trace_factory.full_resolution_traces.update(traces)
+            add_spans(worker_spans)
+
+    logging.info(f"Built {len(jobs)} figures in {time.perf_counter() - start_time:.2f} s")
+    return figures
@@ -0,0 +1,99 @@
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from modules.figure_formatter import format_figure
+from modules.spectral_analysis import accumulate_chunks
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
+
+message_name = "sensor_combined"
+
+figure_title = "IMU spectrogram"
+
+# the spectral analysis is CPU bound, run this reader in a worker process
+executor_type = "process"
+
+# {field: subplot title}
+spectrogram_fields = {
+    "accelerometer_m_s2[0]": "Acceleration spectrogram (X)",
+    "accelerometer_m_s2[1]": "Acceleration spectrogram (Y)",
+    "accelerometer_m_s2[2]": "Acceleration spectrogram (Z)",
+    "gyro_rad[0]": "Angular rate spectrogram (X)",
+    "gyro_rad[1]": "Angular rate spectrogram (Y)",
+    "gyro_rad[2]": "Angular rate spectrogram (Z)",
+}
+
+required_fields = ["timestamp"] + list(spectrogram_fields.keys())
+
+# shorter segments than the Welch PSD for a better time resolution
+segment_length = 256
+
+max_time_bins = 500
+
+
+def read_sensor_combined_spectrogram_data(topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    timestamp_field = "timestamp"
+
+    rows = 6
+    subplot_titles = list(spectrogram_fields.values())
+    if len(subplot_titles) != rows:
+        raise Exception("Number of subplots is wrong")
+
+    fig = make_subplots(
+        rows=rows,
+        cols=1,
+        vertical_spacing=0.03,
+        shared_xaxes=True,
+        subplot_titles=subplot_titles,
+    )
+
+    # the topic is streamed in chunks, the full series is never loaded at once
+    fields = list(spectrogram_fields.keys())
+    accumulator = accumulate_chunks(
+        topic_source.iter_chunks(message_name, dataset_num, [timestamp_field] + fields),
+        timestamp_field,
+        fields,
+        end_us=int(topic_source.get_dataset(message_name, dataset_num)[timestamp_field][-1]),
+        segment_length=segment_length,
+        max_time_bins=max_time_bins,
+    )
+    frequencies, timestamps, psd = accumulator.get_spectrogram()
+
+    # dB (rounded to keep the figure small), the small offset avoids log(0) for constant signals
+    psd_db = np.round(10 * np.log10(psd + 1e-12), 1)
+
+    for field_num, (field, title) in enumerate(spectrogram_fields.items()):
+        fig.add_trace(
+            go.Heatmap(
+                x=time_base.to_datetime(timestamps),
+                y=frequencies,
+                z=psd_db[:, field_num].T,
+                coloraxis="coloraxis" if field.startswith("accelerometer") else "coloraxis2",
+                name=title,
+            ),
+            row=field_num + 1,
+            col=1,
+        )
+
+    format_figure(fig)
+
+    # separate color scales for the acceleration and the angular rate, next to their subplots
+    fig.update_layout(
+        title_text=f"{figure_title} {dataset_num}",
+        coloraxis={
+            "colorscale": "Viridis",
+            "colorbar": {"title": "Acceleration PSD (dB)", "y": fig.layout.yaxis2.domain[1], "yanchor": "middle"},
+        },
+        coloraxis2={
+            "colorscale": "Viridis",
+            "colorbar": {"title": "Angular rate PSD (dB)", "y": fig.layout.yaxis5.domain[1], "yanchor": "middle"},
+        },
+        autosize=True,
+    )
+
+    # show x axis labels in every subplot
+    fig.update_xaxes(showticklabels=True)
+    fig.update_yaxes(title_text="Frequency (Hz)")
+
+    return fig
@@ -0,0 +1,201 @@
+import numpy as np
+
+# segment length (samples) and overlap (fraction of a segment) of the Welch PSD and the spectrogram
+default_segment_length = 1024
+default_overlap = 0.5
+
+# number of samples buffered before the sample rate is estimated
+sample_rate_sample_count = 10000
+
+# number of segments transformed at once, this bounds the memory use independent of the log length
+segment_batch_size = 256
+
+
+def get_sample_rate(timestamps_us: np.ndarray):
+    """This function estimates the sample rate (Hz) from the median sample interval, so logging dropouts don't
+    bias it."""
+    intervals_us = np.diff(np.asarray(timestamps_us).astype(np.int64))
+    return 1e6 / np.median(intervals_us[intervals_us > 0])
+
+
+def get_segment_step(segment_length: int, overlap: float):
+    return max(int(segment_length * (1 - overlap)), 1)
+
+
+def get_segment_count(duration_us: int, sample_rate: float, segment_length: int, overlap: float):
+    """This function returns the number of complete segments of a uniformly resampled series."""
+    sample_count = int(duration_us * sample_rate / 1e6) + 1
+    if sample_count < segment_length:
+        return 0
+
+    return (sample_count - segment_length) // get_segment_step(segment_length, overlap) + 1
+
+
+class SpectralAccumulator:
+    """Welch PSD and spectrogram of several columns, updated chunk by chunk. Only the raw samples the next segments
+    still need are kept, so the memory use doesn't grow with the length of the series.
+
+    The sample rate is estimated from the first sample_rate_sample_count samples, the samples are interpolated onto a
+    uniform grid at that rate and split into Hann windowed segments which are transformed with one batched rfft."""
+
+    def __init__(
+        self,
+        column_count: int,
+        end_us: int,
+        segment_length: int = default_segment_length,
+        overlap: float = default_overlap,
+        max_time_bins: int = None,
+    ):
+        self.column_count = column_count
+        # the last timestamp of the series, needed to split the spectrogram into time bins upfront
+        self.end_us = end_us
+        self.segment_length = segment_length
+        self.overlap = overlap
+        # None disables the spectrogram
+        self.max_time_bins = max_time_bins
+
+        # set by the first update
+        self.start_us = None
+        self.sample_rate = None
+
+        self.next_segment = 0
+        # samples still needed by the next segments, timestamps relative to start_us
+        self.pending_timestamps_us = np.empty(0, dtype=np.int64)
+        self.pending_columns = [np.empty(0) for _ in range(column_count)]
+
+    def start(self):
+        """This function fixes the uniform grid, the first samples are buffered until then."""
+        self.start_us = int(self.pending_timestamps_us[0])
+        self.sample_rate = get_sample_rate(self.pending_timestamps_us)
+        self.sample_interval_us = 1e6 / self.sample_rate
+        self.pending_timestamps_us = self.pending_timestamps_us - self.start_us
+
+        duration_us = self.end_us - self.start_us
+        self.segment_length = min(self.segment_length, int(duration_us * self.sample_rate / 1e6) + 1)
+        self.step = get_segment_step(self.segment_length, self.overlap)
+        self.segment_count = get_segment_count(duration_us, self.sample_rate, self.segment_length, self.overlap)
+
+        self.window = np.hanning(self.segment_length)
+        # density scaling, the energy of the negative frequencies is added to the positive ones
+        self.scale = np.full(self.segment_length // 2 + 1, 2 / (self.sample_rate * np.sum(self.window**2)))
+        self.scale[0] /= 2
+        if self.segment_length % 2 == 0:
+            self.scale[-1] /= 2
+
+        self.psd_sum = np.zeros((self.column_count, self.segment_length // 2 + 1))
+
+        if self.max_time_bins is not None:
+            self.segments_per_bin = max(int(np.ceil(self.segment_count / self.max_time_bins)), 1)
+            bin_count = int(np.ceil(self.segment_count / self.segments_per_bin))
+            self.bin_psd_sum = np.zeros((bin_count, self.column_count, self.segment_length // 2 + 1))
+            self.bin_timestamp_sum = np.zeros(bin_count)
+            self.bin_segment_count = np.zeros(bin_count)
+
+    def update(self, timestamps_us: np.ndarray, columns: list[np.ndarray]):
+        self.pending_timestamps_us = np.concatenate(
+            (self.pending_timestamps_us, np.asarray(timestamps_us).astype(np.int64) - (self.start_us or 0))
+        )
+        self.pending_columns = [
+            np.concatenate((pending_column, np.asarray(column, dtype=np.float64)))
+            for pending_column, column in zip(self.pending_columns, columns)
+        ]
+
+        if self.start_us is None:
+            if len(self.pending_timestamps_us) < sample_rate_sample_count:
+                return
+            self.start()
+
+        self.add_ready_segments()
+
+    def finish(self):
+        # series shorter than sample_rate_sample_count
+        if self.start_us is None and len(self.pending_timestamps_us) >= 2:
+            self.start()
+            self.add_ready_segments()
+
+    def add_ready_segments(self):
+        timestamps_us = self.pending_timestamps_us
+        columns = self.pending_columns
+
+        # segments whose uniform grid is completely covered by the received samples
+        ready_segment_count = min(
+            get_segment_count(timestamps_us[-1], self.sample_rate, self.segment_length, self.overlap),
+            self.segment_count,
+        )
+
+        for first_segment in range(self.next_segment, ready_segment_count, segment_batch_size):
+            segments = np.arange(first_segment, min(first_segment + segment_batch_size, ready_segment_count))
+            self.add_segments(segments, timestamps_us, columns)
+        self.next_segment = max(self.next_segment, ready_segment_count)
+
+        # keep one sample before the next segment for the interpolation
+        first_needed = max(
+            np.searchsorted(timestamps_us, self.next_segment * self.step * self.sample_interval_us, side="right") - 1,
+            0,
+        )
+        self.pending_timestamps_us = timestamps_us[first_needed:]
+        self.pending_columns = [column[first_needed:] for column in columns]
+
+    def add_segments(self, segments: np.ndarray, timestamps_us: np.ndarray, columns: list[np.ndarray]):
+        segment_offsets = segments * self.step
+        grid_us = (segment_offsets[:, None] + np.arange(self.segment_length)) * self.sample_interval_us
+
+        # shape (segments, columns, samples)
+        samples = np.stack([np.interp(grid_us, timestamps_us, column) for column in columns], axis=1)
+        samples -= samples.mean(axis=-1, keepdims=True)
+
+        spectra = np.abs(np.fft.rfft(samples * self.window, axis=-1)) ** 2 * self.scale
+        self.psd_sum += spectra.sum(axis=0)
+
+        if self.max_time_bins is not None:
+            center_timestamps_us = (segment_offsets + self.segment_length / 2) * self.sample_interval_us
+            bins = segments // self.segments_per_bin
+            np.add.at(self.bin_psd_sum, bins, spectra)
+            np.add.at(self.bin_timestamp_sum, bins, center_timestamps_us)
+            np.add.at(self.bin_segment_count, bins, 1)
+
+    def get_frequencies(self):
+        if self.sample_rate is None:
+            return np.empty(0)
+
+        return np.fft.rfftfreq(self.segment_length, d=1 / self.sample_rate)
+
+    def get_welch(self):
+        """This function returns (frequencies, PSD with shape (columns, frequencies))."""
+        self.finish()
+        if self.sample_rate is None:
+            return np.empty(0), np.empty((self.column_count, 0))
+
+        return self.get_frequencies(), self.psd_sum / max(self.next_segment, 1)
+
+    def get_spectrogram(self):
+        """This function returns (frequencies, timestamps, PSD with shape (time bins, columns, frequencies)).
+        Neighbouring segments are averaged so there are at most max_time_bins time bins."""
+        self.finish()
+        if self.sample_rate is None or self.max_time_bins is None:
+            return np.empty(0), np.empty(0, dtype=np.int64), np.empty((0, self.column_count, 0))
+
+        used_bins = self.bin_segment_count > 0
+        return (
+            self.get_frequencies(),
+            self.start_us + (self.bin_timestamp_sum[used_bins] / self.bin_segment_count[used_bins]).astype(np.int64),
+            self.bin_psd_sum[used_bins] / self.bin_segment_count[used_bins, None, None],
+        )
+
+
+def accumulate_chunks(
+    chunks,
+    timestamp_field: str,
+    fields: list[str],
+    end_us: int,
+    segment_length: int = default_segment_length,
+    overlap: float = default_overlap,
+    max_time_bins: int = None,
+):
+    """This function feeds chunks ({field: column}, e.g. from TopicSource.iter_chunks) into a SpectralAccumulator."""
+    accumulator = SpectralAccumulator(len(fields), end_us, segment_length, overlap, max_time_bins)
+
+    for chunk in chunks:
+        accumulator.update(chunk[timestamp_field], [chunk[field] for field in fields])
+
+    return accumulator
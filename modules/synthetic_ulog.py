@@ -0,0 +1,327 @@
+import struct
+import numpy as np
+
+from modules.ulog_reader import header_bytes
+
+# formats of the generated topics, laid out like the PX4 messages: {format name: [(type, array size, field name)]}
+topic_formats = {
+    "esc_report": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint32_t", 0, "esc_errorcount"),
+        ("int32_t", 0, "esc_rpm"),
+        ("float", 0, "esc_voltage"),
+        ("float", 0, "esc_current"),
+        ("float", 0, "esc_temperature"),
+        ("uint16_t", 0, "failures"),
+        ("uint8_t", 0, "esc_address"),
+        ("uint8_t", 0, "esc_cmdcount"),
+        ("uint8_t", 0, "esc_state"),
+        ("uint8_t", 0, "actuator_function"),
+        ("int8_t", 0, "esc_power"),
+        ("uint8_t", 3, "_padding0"),
+    ],
+    "esc_status": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint16_t", 0, "counter"),
+        ("uint8_t", 0, "esc_count"),
+        ("uint8_t", 0, "esc_connectiontype"),
+        ("uint8_t", 0, "esc_online_flags"),
+        ("uint8_t", 0, "esc_armed_flags"),
+        ("uint8_t", 2, "_padding0"),
+        ("esc_report", 8, "esc"),
+    ],
+    "battery_status": [
+        ("uint64_t", 0, "timestamp"),
+        ("float", 0, "voltage_v"),
+        ("float", 0, "voltage_filtered_v"),
+        ("float", 0, "current_a"),
+        ("float", 0, "current_filtered_a"),
+        ("float", 0, "current_average_a"),
+        ("float", 0, "discharged_mah"),
+        ("float", 0, "remaining"),
+        ("float", 0, "scale"),
+        ("float", 0, "time_remaining_s"),
+        ("float", 0, "temperature"),
+        ("float", 14, "voltage_cell_v"),
+        ("uint8_t", 0, "cell_count"),
+        ("bool", 0, "connected"),
+        ("uint8_t", 0, "warning"),
+        ("uint8_t", 1, "_padding0"),
+    ],
+    "system_power": [
+        ("uint64_t", 0, "timestamp"),
+        ("float", 0, "voltage5v_v"),
+        ("float", 4, "sensors3v3"),
+        ("uint8_t", 0, "sensors3v3_valid"),
+        ("uint8_t", 0, "usb_connected"),
+        ("uint8_t", 0, "brick_valid"),
+        ("uint8_t", 0, "usb_valid"),
+        ("uint8_t", 0, "servo_valid"),
+        ("uint8_t", 0, "periph_5v_oc"),
+        ("uint8_t", 0, "hipower_5v_oc"),
+        ("uint8_t", 0, "comp_5v_valid"),
+        ("uint8_t", 0, "can1_gps1_5v_valid"),
+        ("uint8_t", 3, "_padding0"),
+    ],
+    "actuator_motors": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint64_t", 0, "timestamp_sample"),
+        ("float", 12, "control"),
+        ("uint16_t", 0, "reversible_flags"),
+        ("uint8_t", 6, "_padding0"),
+    ],
+    "airspeed": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint64_t", 0, "timestamp_sample"),
+        ("float", 0, "indicated_airspeed_m_s"),
+        ("float", 0, "true_airspeed_m_s"),
+        ("float", 0, "air_temperature_celsius"),
+        ("float", 0, "confidence"),
+    ],
+    "airspeed_validated": [
+        ("uint64_t", 0, "timestamp"),
+        ("float", 0, "indicated_airspeed_m_s"),
+        ("float", 0, "calibrated_airspeed_m_s"),
+        ("float", 0, "true_airspeed_m_s"),
+        ("float", 0, "calibrated_ground_minus_wind_m_s"),
+        ("float", 0, "true_ground_minus_wind_m_s"),
+        ("bool", 0, "airspeed_sensor_measurement_valid"),
+        ("int8_t", 0, "selected_airspeed_index"),
+        ("uint8_t", 2, "_padding0"),
+    ],
+    "vehicle_gps_position": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint64_t", 0, "timestamp_sample"),
+        ("uint64_t", 0, "time_utc_usec"),
+        ("double", 0, "latitude_deg"),
+        ("double", 0, "longitude_deg"),
+        ("double", 0, "altitude_msl_m"),
+        ("double", 0, "altitude_ellipsoid_m"),
+        ("uint32_t", 0, "device_id"),
+        ("float", 0, "eph"),
+        ("float", 0, "epv"),
+        ("float", 0, "hdop"),
+        ("float", 0, "vdop"),
+        ("int32_t", 0, "noise_per_ms"),
+        ("int32_t", 0, "jamming_indicator"),
+        ("float", 0, "vel_m_s"),
+        ("float", 0, "vel_n_m_s"),
+        ("float", 0, "vel_e_m_s"),
+        ("float", 0, "vel_d_m_s"),
+        ("float", 0, "heading"),
+        ("float", 0, "heading_accuracy"),
+        ("uint8_t", 0, "fix_type"),
+        ("uint8_t", 0, "jamming_state"),
+        ("bool", 0, "vel_ned_valid"),
+        ("uint8_t", 0, "satellites_used"),
+    ],
+    "sensor_combined": [
+        ("uint64_t", 0, "timestamp"),
+        ("float", 3, "gyro_rad"),
+        ("uint32_t", 0, "gyro_integral_dt"),
+        ("int32_t", 0, "accelerometer_timestamp_relative"),
+        ("float", 3, "accelerometer_m_s2"),
+        ("uint32_t", 0, "accelerometer_integral_dt"),
+        ("uint8_t", 0, "accelerometer_clipping"),
+        ("uint8_t", 0, "gyro_clipping"),
+        ("uint8_t", 0, "accel_calibration_count"),
+        ("uint8_t", 0, "gyro_calibration_count"),
+    ],
+    "vehicle_status": [
+        ("uint64_t", 0, "timestamp"),
+        ("uint8_t", 0, "arming_state"),
+        ("uint8_t", 7, "_padding0"),
+    ],
+    "vehicle_land_detected": [
+        ("uint64_t", 0, "timestamp"),
+        ("bool", 0, "freefall"),
+        ("bool", 0, "ground_contact"),
+        ("bool", 0, "maybe_landed"),
+        ("bool", 0, "landed"),
+        ("uint8_t", 4, "_padding0"),
+    ],
+}
+
+# publication rates (Hz) of the logged topics
+default_rates = {
+    "battery_status": 10,
+    "system_power": 5,
+    "esc_status": 50,
+    "actuator_motors": 100,
+    "airspeed": 20,
+    "airspeed_validated": 20,
+    "vehicle_gps_position": 5,
+    "sensor_combined": 500,
+    "vehicle_status": 2,
+    "vehicle_land_detected": 2,
+}
+
+# number of instances (multi ids) of the logged topics, 1 if not listed
+default_multi_instances = {"battery_status": 2}
+
+# {ulog type: little endian numpy type}, bools are written as single bytes
+record_types = {
+    "int8_t": "i1",
+    "uint8_t": "u1",
+    "int16_t": "<i2",
+    "uint16_t": "<u2",
+    "int32_t": "<i4",
+    "uint32_t": "<u4",
+    "int64_t": "<i8",
+    "uint64_t": "<u8",
+    "float": "<f4",
+    "double": "<f8",
+    "bool": "u1",
+    "char": "i1",
+}
+
+start_timestamp_us = 5000000
+
+# the GPS time of the first sample: 2023-11-14 22:13:20 UTC
+start_utc_us = 1700000000000000
+
+# the messages are written in windows of this length, which bounds the memory use for long logs
+write_window_us = 60000000
+
+
+def get_record_fields(format_name: str, prefix: str = ""):
+    """This function flattens a format into the fields of a data message: [(field name, numpy type)]."""
+    fields = []
+    for field_type, array_size, field_name in topic_formats[format_name]:
+        names = [f"{field_name}[{x}]" for x in range(array_size)] if array_size > 0 else [field_name]
+        for name in names:
+            if field_type in record_types:
+                fields.append((prefix + name, record_types[field_type]))
+            else:
+                fields.extend(get_record_fields(field_type, f"{prefix}{name}."))
+
+    return fields
+
+
+def get_message_fields(message_name: str):
+    """This function returns the fields of a data message, the logger doesn't write the padding at the end."""
+    fields = get_record_fields(message_name)
+    while len(fields) > 0 and fields[-1][0].startswith("_padding"):
+        fields.pop()
+
+    return fields
+
+
+def fill_records(message_name: str, records: np.ndarray, timestamps: np.ndarray, arm_us: int, rng):
+    """This function fills the fields of a topic with plausible values: noisy sine waves and small integers, plus
+    an arming, a takeoff, a GPS fix and the battery sag after arming so the flight events can be found."""
+    sample_nums = np.arange(len(records))
+    armed = timestamps > arm_us
+
+    for field_name in records.dtype.names:
+        if field_name.split(".")[-1].startswith("_padding"):
+            continue
+
+        if field_name.endswith("timestamp") or field_name == "timestamp_sample":
+            records[field_name] = timestamps
+        elif records.dtype[field_name].kind == "f":
+            records[field_name] = np.sin(sample_nums / 50 + len(field_name)) * 10 + rng.normal(0, 0.5, len(records))
+        else:
+            records[field_name] = rng.integers(0, 3, len(records))
+
+    if message_name == "vehicle_gps_position":
+        records["time_utc_usec"] = np.where(sample_nums > 3, timestamps - start_timestamp_us + start_utc_us, 0)
+        records["fix_type"] = np.where(sample_nums > 10, 3, 0)
+    elif message_name == "vehicle_status":
+        records["arming_state"] = np.where(armed, 2, 1)
+    elif message_name == "vehicle_land_detected":
+        records["landed"] = np.where(timestamps > arm_us + 5000000, 0, 1)
+    elif message_name == "battery_status":
+        records["voltage_v"] = 25 - np.where(armed, 2, 0) + rng.normal(0, 0.05, len(records))
+    elif message_name == "esc_status":
+        for x in range(8):
+            records[f"esc[{x}].esc_temperature"] = 30 + 40 * armed + rng.normal(0, 1, len(records))
+
+
+def get_message(message_type: str, payload: bytes):
+    return struct.pack("<HB", len(payload), ord(message_type)) + payload
+
+
+def write_synthetic_ulog(
+    ulog_filename: str,
+    duration_s: float = 60,
+    rates: dict = None,
+    multi_instances: dict = None,
+    arm_s: float = 10,
+    seed: int = 0,
+):
+    """This function writes a valid ulog file with the given topics ({message_name: rate (Hz)}) and instances
+    ({message_name: count}). The data messages of all topics are interleaved in timestamp order like in a real log.
+    Returns the number of data messages."""
+    rates = default_rates if rates is None else rates
+    multi_instances = default_multi_instances if multi_instances is None else multi_instances
+    rng = np.random.default_rng(seed)
+    end_us = start_timestamp_us + int(duration_s * 1000000)
+
+    # one subscription per topic instance: (message_name, multi_id, msg_id, timestamps, data messages)
+    subscriptions = []
+    for message_name, rate in rates.items():
+        for multi_id in range(multi_instances.get(message_name, 1)):
+            msg_id = len(subscriptions)
+            dtype = np.dtype(
+                [("msg_size", "<u2"), ("msg_type", "u1"), ("msg_id", "<u2")] + get_message_fields(message_name)
+            )
+
+            sample_count = int(duration_s * rate)
+            timestamps = start_timestamp_us + (np.arange(sample_count) * 1e6 / rate).astype(np.uint64)
+            # publication jitter
+            timestamps += rng.integers(0, 200, sample_count).astype(np.uint64)
+
+            records = np.zeros(sample_count, dtype)
+            fill_records(message_name, records, timestamps, start_timestamp_us + int(arm_s * 1000000), rng)
+            records["msg_size"] = dtype.itemsize - 3
+            records["msg_type"] = ord("D")
+            records["msg_id"] = msg_id
+
+            subscriptions.append((message_name, multi_id, msg_id, timestamps, records))
+
+    with open(ulog_filename, "wb") as file:
+        file.write(header_bytes + b"\x01" + struct.pack("<Q", start_timestamp_us))
+        # no compat or incompat flags, no appended data
+        file.write(get_message("B", bytes(40)))
+
+        for format_name, fields in topic_formats.items():
+            format_fields = "".join(
+                f"{field_type}[{array_size}] {field_name};" if array_size > 0 else f"{field_type} {field_name};"
+                for field_type, array_size, field_name in fields
+            )
+            file.write(get_message("F", f"{format_name}:{format_fields}".encode()))
+
+        for message_name, multi_id, msg_id, _, _ in subscriptions:
+            file.write(get_message("A", struct.pack("<BH", multi_id, msg_id) + message_name.encode()))
+
+        for window_start_us in range(start_timestamp_us, end_us + write_window_us, write_window_us):
+            file.write(get_window_bytes(subscriptions, window_start_us, window_start_us + write_window_us))
+
+    return sum(len(timestamps) for _, _, _, timestamps, _ in subscriptions)
+
+
+def get_window_bytes(subscriptions: list, start_us: int, end_us: int):
+    """This function merges the data messages of all topics within a time window in timestamp order."""
+    windows = []
+    for _, _, _, timestamps, records in subscriptions:
+        start, end = np.searchsorted(timestamps, [start_us, end_us])
+        windows.append((timestamps[start:end], records[start:end]))
+
+    timestamps = np.concatenate([timestamps for timestamps, _ in windows])
+    sizes = np.concatenate([np.full(len(records), records.dtype.itemsize) for _, records in windows])
+    order = np.argsort(timestamps, kind="stable")
+
+    # the position of every message in the merged window
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.concatenate(([0], np.cumsum(sizes[order])[:-1])) if len(order) > 0 else []
+
+    window_bytes = np.empty(int(sizes.sum()), dtype=np.uint8)
+    first = 0
+    for _, records in windows:
+        record_positions = positions[first : first + len(records)]
+        record_bytes = records.view(np.uint8).reshape(len(records), records.dtype.itemsize)
+        window_bytes[record_positions[:, None] + np.arange(records.dtype.itemsize)] = record_bytes
+        first += len(records)
+
+    return window_bytes.tobytes()
@@ -1,178 +1,56 @@
-import logging
-import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-
-from modules.csv_reader import get_csv_file, get_multi_id_num
-from modules.figure_formatter import format_figure
-from modules.timestamp_helper import fix_timestamps
-
-
-def read_system_power_data(tmp_dirname: str, ulog_filename: str):
-    message_name = "system_power"
-
-    dataset_count = get_multi_id_num(tmp_dirname, message_name)
-    logging.info(f"Found {dataset_count} {message_name} data sets")
-
-    timestamp_field = "timestamp"
-
-    figs = []
-
-    for dataset_num in range(dataset_count):
-        # read in csv
-        df = pd.read_csv(get_csv_file(tmp_dirname, ulog_filename, message_name, dataset_num))
-        fix_timestamps(df, timestamp_field)
-
-        count_3v3_sensors = 4
-
-        rows = 8
-        subplot_titles = [
-            "Voltage 5V",
-            "Voltage 3.3V",
-            "Sensors 3.3V valid",
-            "Brick valid",
-            "Servo valid",
-            "5V overcurrent",
-            "5V to companion valid",
-            "CAN1/GPS1 5V valid",
-        ]
-        if len(subplot_titles) != rows:
-            raise Exception("Number of subplots is wrong")
-
-        fig = make_subplots(
-            rows=rows,
-            cols=1,
-            vertical_spacing=0.02,
-            shared_xaxes=True,
-            subplot_titles=subplot_titles,
-        )
-
-        # Voltage 5V
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["voltage5v_v"],
-                mode="lines",
-                name="Voltage 5V",
-            ),
-        )
-
-        # Voltage 3.3V
-        for x in range(count_3v3_sensors):
-            fig.add_trace(
-                col=1,
-                row=2,
-                trace=go.Scatter(
-                    x=df[timestamp_field],
-                    y=df[f"sensors3v3[{x}]"],
-                    mode="lines",
-                    name=f"Voltage 3.3V [{x+1}]",
-                ),
-            )
-
-        # Sensors 3.3V valid
-        fig.add_trace(
-            col=1,
-            row=3,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["sensors3v3_valid"],
-                mode="lines",
-                name="Sensors 3.3V valid",
-            ),
-        )
-
-        # Brick valid
-        fig.add_trace(
-            col=1,
-            row=4,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["brick_valid"],
-                mode="lines",
-                name="Brick valid",
-            ),
-        )
-
-        # Servo valid
-        fig.add_trace(
-            col=1,
-            row=5,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["servo_valid"],
-                mode="lines",
-                name="Servo valid",
-            ),
-        )
-
-        # 5V overcurrent
-        fig.add_trace(
-            col=1,
-            row=6,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["periph_5v_oc"],
-                mode="lines",
-                name="Peripheral 5V overcurrent",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=6,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["hipower_5v_oc"],
-                mode="lines",
-                name="High power peripheral 5V overcurrent",
-            ),
-        )
-
-        # 5V to companion valid
-        fig.add_trace(
-            col=1,
-            row=7,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["comp_5v_valid"],
-                mode="lines",
-                name="5V to companion valid",
-            ),
-        )
-
-        # CAN1/GPS1 5V valid
-        fig.add_trace(
-            col=1,
-            row=8,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df["can1_gps1_5v_valid"],
-                mode="lines",
-                name="CAN1/GPS1 5V valid",
-            ),
-        )
-
-        format_figure(fig)
-
-        # show x axis labels in every subplot
-        fig.update_layout(
-            title_text=f"System power {dataset_num}",
-            autosize=True,
-            xaxis_showticklabels=True,
-            xaxis2_showticklabels=True,
-            xaxis3_showticklabels=True,
-            xaxis4_showticklabels=True,
-            xaxis5_showticklabels=True,
-            xaxis6_showticklabels=True,
-            xaxis7_showticklabels=True,
-            xaxis8_showticklabels=True,
-            yaxis={"ticksuffix": "V"},
-            yaxis2={"ticksuffix": "V"},
-        )
-
-        figs.append(fig)
-
-    return figs
+from modules.figure_spec import render_figure
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
+
+message_name = "system_power"
+
+figure_title = "System power"
+
+count_3v3_sensors = 4
+
+required_fields = [
+    "timestamp",
+    "voltage5v_v",
+    "sensors3v3_valid",
+    "brick_valid",
+    "servo_valid",
+    "periph_5v_oc",
+    "hipower_5v_oc",
+    "comp_5v_valid",
+    "can1_gps1_5v_valid",
+] + [f"sensors3v3[{x}]" for x in range(count_3v3_sensors)]
+
+
+# subplots of the figure, see modules/figure_spec.py
+figure_spec = {
+    "timestamp_field": "timestamp",
+    "rows": [
+        {"title": "Voltage 5V", "unit": "V", "traces": [{"field": "voltage5v_v", "name": "Voltage 5V"}]},
+        {
+            "title": "Voltage 3.3V",
+            "unit": "V",
+            "traces": [
+                {"field": "sensors3v3[{index}]", "name": "Voltage 3.3V [{number}]", "count": count_3v3_sensors}
+            ],
+        },
+        {"title": "Sensors 3.3V valid", "traces": [{"field": "sensors3v3_valid", "name": "Sensors 3.3V valid"}]},
+        {"title": "Brick valid", "traces": [{"field": "brick_valid", "name": "Brick valid"}]},
+        {"title": "Servo valid", "traces": [{"field": "servo_valid", "name": "Servo valid"}]},
+        {
+            "title": "5V overcurrent",
+            "traces": [
+                {"field": "periph_5v_oc", "name": "Peripheral 5V overcurrent"},
+                {"field": "hipower_5v_oc", "name": "High power peripheral 5V overcurrent"},
+            ],
+        },
+        {"title": "5V to companion valid", "traces": [{"field": "comp_5v_valid", "name": "5V to companion valid"}]},
+        {"title": "CAN1/GPS1 5V valid", "traces": [{"field": "can1_gps1_5v_valid", "name": "CAN1/GPS1 5V valid"}]},
+    ],
+}
+
+
+def read_system_power_data(topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    # read in topic data
+    df = topic_source.get_data_frame(message_name, dataset_num)
+
+    return render_figure(figure_spec, df, time_base, f"{figure_title} {dataset_num}")
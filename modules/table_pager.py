@@ -0,0 +1,109 @@
+import math
+import re
+import pandas as pd
+
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
+
+default_page_size = 50
+
+# relational operators of the DataTable filter syntax: {filter operator: pandas.Series method}
+filter_operators = {
+    ">=": "ge",
+    "<=": "le",
+    "!=": "ne",
+    "=": "eq",
+    ">": "gt",
+    "<": "lt",
+    "ge": "ge",
+    "le": "le",
+    "ne": "ne",
+    "eq": "eq",
+    "gt": "gt",
+    "lt": "lt",
+    "contains": "contains",
+    "datestartswith": "startswith",
+}
+
+# e.g. "{fix_type} s>= 3", the optional prefix selects case sensitive (s) or insensitive (i) comparisons
+filter_part_pattern = re.compile(
+    r"\{(?P<column>[^}]+)\}\s*(?P<case>[si]?)(?P<operator>"
+    + "|".join(re.escape(operator) for operator in filter_operators)
+    + r")\s*(?P<value>.*)"
+)
+
+
+def get_table_data(topic_source: TopicSource, time_base: TimeBase, message_name: str, dataset_num: int, columns: list):
+    """This function returns the raw data of a topic as DataFrame, timestamps are converted to local time."""
+    data = topic_source.get_dataset(message_name, dataset_num)
+    return pd.DataFrame(
+        {column: time_base.to_datetime(data[column]) if column == "timestamp" else data[column] for column in columns}
+    )
+
+
+def parse_filter_value(value: str):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+        return value[1:-1]
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def filter_data_frame(df: pd.DataFrame, filter_query: str):
+    """This function applies a DataTable filter query (expressions joined by "&&") to a DataFrame."""
+    for filter_part in filter_query.split(" && "):
+        match = filter_part_pattern.fullmatch(filter_part.strip())
+        if match is None or match["column"] not in df.columns:
+            raise ValueError(f"Invalid filter {filter_part}")
+
+        operator = filter_operators[match["operator"]]
+        value = parse_filter_value(match["value"])
+        values = df[match["column"]]
+
+        # dates and strings are compared as text
+        if operator in ["contains", "startswith"]:
+            value = match["value"].strip().strip("\"'`")
+        if isinstance(value, str):
+            values = values.astype(str)
+            if match["case"] == "i":
+                values = values.str.lower()
+                value = value.lower()
+
+        if operator == "contains":
+            df = df[values.str.contains(value, regex=False)]
+        elif operator == "startswith":
+            df = df[values.str.startswith(value)]
+        else:
+            df = df[getattr(values, operator)(value)]
+
+    return df
+
+
+def get_table_page(
+    df: pd.DataFrame,
+    page_current: int,
+    page_size: int = default_page_size,
+    sort_by: list = None,
+    filter_query: str = "",
+):
+    """This function filters and sorts the table on the server and returns (records of the page, page count), only
+    the visible page is sent to the browser."""
+    if filter_query:
+        df = filter_data_frame(df, filter_query)
+
+    if sort_by:
+        df = df.sort_values(
+            [sort["column_id"] for sort in sort_by],
+            ascending=[sort["direction"] == "asc" for sort in sort_by],
+            kind="stable",
+        )
+
+    page = df.iloc[page_current * page_size : (page_current + 1) * page_size]
+
+    # datetimes are sent as text
+    page = page.astype({column: str for column in page.columns if pd.api.types.is_datetime64_any_dtype(page[column])})
+
+    return page.to_dict("records"), max(math.ceil(len(df) / page_size), 1)
@@ -1,47 +1,145 @@
 from datetime import UTC, datetime
 import logging
 import numpy as np
-from pyulog import ULog
 import time
 
-import pandas as pd
+from modules import topic_cache
+from modules.instrumentation import span
+from modules.topic_source import TopicSource, load_topic_source
+from modules.ulog_reader import UlogReader
 
-start_timestamp_us = 0
-logging_start_time_us = 0
+message_name = "vehicle_gps_position"
+
+required_fields = ["timestamp", "time_utc_usec"]
 
 
 def timestamp_to_datetime(timestamp_us: int):
     return datetime.fromtimestamp(timestamp_us / 1000000, UTC).strftime("%Y-%m-%d %H:%M:%S")
 
 
-def get_first_gps_timestamp(ulog: ULog):
-    """This function tries to identify the first GPS timestamp."""
-    global logging_start_time_us, start_timestamp_us
+class TimeBase:
+    """Timeline of a single log. Timestamps stay int64 microseconds since boot, they are only converted to local
+    time datetimes for plotting."""
 
-    gps_data = ulog.get_dataset("vehicle_gps_position")
-    indices = np.nonzero(gps_data.data["time_utc_usec"])
-    if len(indices[0]) > 0:
-        logging_start_time_us = gps_data.data["time_utc_usec"][indices[0][0]]
-        start_timestamp_us = gps_data.data["timestamp"][indices[0][0]]
-        logging.info(f"First GPS timestamp found: {timestamp_to_datetime(logging_start_time_us)}")
-    else:
-        logging.warning("No GPS timestamp found!")
+    def __init__(self, boot_to_local_offset_us: int = None):
+        # None if the log has no GPS time, the timestamps are plotted as they are then
+        self.boot_to_local_offset_us = boot_to_local_offset_us
 
+    def has_gps_time(self):
+        return self.boot_to_local_offset_us is not None
 
-def fix_timestamps(df, timestamp_field):
-    """This function adjusts timestamps so they are in the local timezone."""
+    def to_datetime(self, timestamps_us: np.ndarray):
+        """This function converts boot timestamps to local time."""
+        timestamps_us = np.asarray(timestamps_us).astype(np.int64)
 
-    if start_timestamp_us == 0 or logging_start_time_us == 0:
-        logging.warning("GPS timestamps not found, can't fix timestamp offsets.")
-        return
+        if not self.has_gps_time():
+            return timestamps_us
 
-    # used to transform everything into local timezone
-    utc_offset_us = int(time.timezone * 1000000)
+        return (timestamps_us + self.boot_to_local_offset_us).astype("datetime64[us]")
+
+    def to_timestamp_us(self, local_time: np.datetime64):
+        """This function converts a local time back to a boot timestamp."""
+        return int(np.datetime64(local_time, "us").astype(np.int64)) - self.boot_to_local_offset_us
+
+    def utc_to_timestamp_us(self, utc_time: np.datetime64):
+        """This function converts a UTC time to a boot timestamp."""
+        return self.to_timestamp_us(np.datetime64(utc_time, "us") - np.timedelta64(get_utc_offset_us(), "us"))
+
+
+def get_utc_offset_us():
+    """This function returns the offset of the local timezone to UTC (positive west of UTC)."""
+    return int(time.timezone * 1000000)
+
+
+def parse_time(value: str, time_base: TimeBase, log_start_us: int):
+    """This function converts a time of the command line to a boot timestamp: either seconds since the start of the
+    log (e.g. 120.5) or an absolute UTC date and time (e.g. 2023-11-14T22:13:40)."""
+    try:
+        return log_start_us + int(float(value) * 1000000)
+    except ValueError:
+        pass
+
+    try:
+        utc_time = np.datetime64(value.strip().replace(" ", "T").removesuffix("Z"), "us")
+    except ValueError:
+        raise Exception(f"Invalid time {value}, expected seconds since the start of the log or a UTC date and time")
+
+    if not time_base.has_gps_time():
+        raise Exception(f"{value} is an absolute time, but the log has no GPS time")
+
+    return time_base.utc_to_timestamp_us(utc_time)
+
+
+def resolve_time_range(log_time_range: tuple, time_base: TimeBase, start: str = None, end: str = None):
+    """This function resolves the --start/--end times of a log to boot timestamps (start_us, end_us), a missing
+    bound is the start or end of the log (log_time_range)."""
+    log_start_us, log_end_us = log_time_range
 
-    # calculate difference to first gps timestamp
-    timestamp_gps_diff_microseconds = int(df[timestamp_field][0] - start_timestamp_us)
+    start_us = parse_time(start, time_base, log_start_us) if start is not None else log_start_us
+    end_us = parse_time(end, time_base, log_start_us) if end is not None else log_end_us
+    if start_us >= end_us:
+        raise Exception(f"The start {start} must be before the end {end}")
 
-    df[timestamp_field] = pd.to_datetime(
-        (df[timestamp_field] - timestamp_gps_diff_microseconds + logging_start_time_us - utc_offset_us),
-        unit="us",
+    logging.info(
+        f"Time range {(start_us - log_start_us) / 1e6:.1f} s to {(end_us - log_start_us) / 1e6:.1f} s of the log"
     )
+    return start_us, end_us
+
+
+@span("time base")
+def get_time_base(topic_source: TopicSource):
+    """This function fits the offset between boot time and GPS time using all valid GPS time samples."""
+    if topic_source.get_multi_id_num(message_name) == 0:
+        logging.warning("No GPS data found!")
+        return TimeBase()
+
+    gps_data = topic_source.get_dataset(message_name)
+    valid = gps_data["time_utc_usec"] != 0
+    if not np.any(valid):
+        logging.warning("No GPS timestamp found, can't fix timestamp offsets.")
+        return TimeBase()
+
+    # the median is robust against single GPS samples with a bad time
+    offsets_us = gps_data["time_utc_usec"][valid].astype(np.int64) - gps_data["timestamp"][valid].astype(np.int64)
+    boot_to_utc_offset_us = int(np.median(offsets_us))
+
+    first_gps_timestamp_us = int(gps_data["time_utc_usec"][valid][0])
+    logging.info(
+        f"First GPS timestamp found: {timestamp_to_datetime(first_gps_timestamp_us)} "
+        f"(time offset fitted from {np.count_nonzero(valid)} samples)"
+    )
+
+    # used to transform everything into local timezone
+    return TimeBase(boot_to_utc_offset_us - get_utc_offset_us())
+
+
+def load_time_range(
+    ulog_filename: str,
+    topic_fields: dict[str, list[str]],
+    start: str = None,
+    end: str = None,
+    cache_dir: str = None,
+    cache_size_mb: int = topic_cache.default_cache_size_mb,
+    index_dir: str = None,
+):
+    """This function loads only the --start/--end time range of the required topics. Returns (topic source, time
+    base fitted from the whole log, (start_us, end_us))."""
+    reader = None
+    if cache_dir is None:
+        try:
+            reader = UlogReader(ulog_filename, index_dir)
+        except Exception as e:
+            logging.warning(f"Reading {ulog_filename} failed ({e}), loading the whole log")
+
+    if reader is not None:
+        # without the topic cache only the index blocks of the time range are decoded
+        with reader:
+            time_base = get_time_base(TopicSource.from_ulog_reader(reader, {message_name: required_fields}))
+            time_range_us = resolve_time_range(reader.get_time_range(list(topic_fields)), time_base, start, end)
+            return TopicSource.from_ulog_reader(reader, topic_fields, *time_range_us), time_base, time_range_us
+
+    # cached topics are memory mapped, the slices only read the pages of the time range
+    topic_source = load_topic_source(ulog_filename, topic_fields, cache_dir, cache_size_mb, index_dir)
+    time_base = get_time_base(topic_source)
+    time_range_us = resolve_time_range(topic_source.get_log_time_range(), time_base, start, end)
+    return topic_source.slice(*time_range_us), time_base, time_range_us
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from modules.topic_store import get_topic_file, read_topic, write_topic_chunks
+
+# bump this whenever the layout of the cache entries changes, older entries are discarded then
+cache_version = 2
+
+default_cache_size_mb = 4096
+
+cache_dirname = ".ulog_analyzer_cache"
+manifest_filename = "manifest.json"
+
+# suffix of the directories cache entries are written into before they are renamed
+tmp_entry_suffix = ".tmp"
+
+# number of bytes hashed at the beginning and the end of the log file
+hash_sample_size = 1024 * 1024
+
+
+def get_default_cache_dir(ulog_filename: str):
+    return os.path.join(os.path.dirname(os.path.abspath(ulog_filename)), cache_dirname)
+
+
+def get_log_key(ulog_filename: str):
+    """This function identifies a log by its size, modification time and content hash."""
+    stat = os.stat(ulog_filename)
+
+    # hashing the beginning and the end is enough to tell logs apart and keeps this fast for GB sized logs
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(ulog_filename, "rb") as file:
+        content_hash.update(file.read(hash_sample_size))
+        if stat.st_size > hash_sample_size:
+            file.seek(max(hash_sample_size, stat.st_size - hash_sample_size))
+            content_hash.update(file.read(hash_sample_size))
+
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "content_hash": content_hash.hexdigest()}
+
+
+def get_entry_dirname(cache_dir: str, ulog_filename: str, log_key: dict):
+    key_hash = hashlib.blake2b(json.dumps(log_key, sort_keys=True).encode(), digest_size=8).hexdigest()
+    base_name = os.path.splitext(os.path.basename(ulog_filename))[0]
+    return os.path.join(cache_dir, f"{base_name}-{key_hash}")
+
+
+def read_manifest(entry_dirname: str):
+    try:
+        with open(os.path.join(entry_dirname, manifest_filename)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def load_topics(ulog_filename: str, required_fields: dict[str, list[str]], cache_dir: str):
+    """This function loads the cached topics of a log file (memory mapped) or returns None on a cache miss, e.g. if
+    the entry was written for fewer fields."""
+    log_key = get_log_key(ulog_filename)
+    entry_dirname = get_entry_dirname(cache_dir, ulog_filename, log_key)
+
+    manifest = read_manifest(entry_dirname)
+    if manifest is None:
+        return None
+
+    if manifest["version"] != cache_version or manifest["log_key"] != log_key:
+        logging.info(f"Discarding outdated cache entry {entry_dirname}")
+        shutil.rmtree(entry_dirname, ignore_errors=True)
+        return None
+
+    cached_fields = manifest["required_fields"]
+    if any(
+        message_name not in cached_fields or not set(fields).issubset(cached_fields[message_name])
+        for message_name, fields in required_fields.items()
+    ):
+        return None
+
+    datasets = {}
+    try:
+        for message_name, multi_ids in manifest["topics"].items():
+            if message_name not in required_fields:
+                continue
+
+            for multi_id in multi_ids:
+                datasets[(message_name, multi_id)] = read_topic(get_topic_file(entry_dirname, message_name, multi_id))
+
+        # the manifest modification time is used for the LRU eviction
+        os.utime(os.path.join(entry_dirname, manifest_filename))
+    except FileNotFoundError:
+        # evicted or replaced by another process meanwhile
+        return None
+
+    logging.info(f"Loaded topics from cache {entry_dirname}")
+    return datasets
+
+
+def write_topics(ulog_filename: str, required_fields: dict[str, list[str]], topics: dict, cache_dir: str):
+    """This function stores the given topics as one .npy file per topic and multi id. Every topic is passed as
+    (sample count, chunks), see write_topic_chunks, so it can be decoded and written chunk by chunk."""
+    log_key = get_log_key(ulog_filename)
+    entry_dirname = get_entry_dirname(cache_dir, ulog_filename, log_key)
+
+    # write into a temporary directory first so that aborted writes never look like valid entries, the directory is
+    # unique for every writer (threads of the server, batch workers)
+    tmp_entry_dirname = tempfile.mkdtemp(
+        suffix=tmp_entry_suffix, prefix=os.path.basename(entry_dirname), dir=cache_dir
+    )
+
+    try:
+        multi_ids = {}
+        for (message_name, multi_id), (sample_count, chunks) in topics.items():
+            write_topic_chunks(get_topic_file(tmp_entry_dirname, message_name, multi_id), chunks, sample_count)
+            multi_ids.setdefault(message_name, []).append(multi_id)
+
+        manifest = {
+            "version": cache_version,
+            "log_key": log_key,
+            "required_fields": required_fields,
+            "topics": multi_ids,
+        }
+        with open(os.path.join(tmp_entry_dirname, manifest_filename), "w") as file:
+            json.dump(manifest, file, indent=4)
+    except Exception:
+        # e.g. a full disk or a corrupt log which is decoded while it is written
+        shutil.rmtree(tmp_entry_dirname, ignore_errors=True)
+        raise
+
+    shutil.rmtree(entry_dirname, ignore_errors=True)
+    try:
+        os.rename(tmp_entry_dirname, entry_dirname)
+    except OSError:
+        # another writer stored the same log meanwhile
+        shutil.rmtree(tmp_entry_dirname, ignore_errors=True)
+        if read_manifest(entry_dirname) is None:
+            raise
+
+    logging.info(f"Wrote topic cache {entry_dirname}")
+    return entry_dirname
+
+
+def get_dir_size(dirname: str):
+    return sum(entry.stat().st_size for entry in os.scandir(dirname) if entry.is_file())
+
+
+def evict_entries(cache_dir: str, max_size_mb: int, keep_dirname: str = None):
+    """This function removes the least recently used cache entries until the cache fits into max_size_mb."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        # entries which are still written are skipped
+        if not entry.is_dir() or entry.path == keep_dirname or entry.name.endswith(tmp_entry_suffix):
+            continue
+
+        try:
+            manifest_mtime = os.path.getmtime(os.path.join(entry.path, manifest_filename))
+            entries.append((manifest_mtime, get_dir_size(entry.path), entry.path))
+        except FileNotFoundError:
+            # no entry (anymore), e.g. removed by another process meanwhile
+            continue
+
+    cache_size = sum(size for _, size, _ in entries) + (get_dir_size(keep_dirname) if keep_dirname else 0)
+    for _, size, entry_dirname in sorted(entries):
+        if cache_size <= max_size_mb * 1024 * 1024:
+            break
+
+        logging.info(f"Evicting cache entry {entry_dirname}")
+        shutil.rmtree(entry_dirname, ignore_errors=True)
+        cache_size -= size
@@ -0,0 +1,265 @@
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+from pyulog import ULog
+
+from modules import topic_cache
+from modules.instrumentation import span
+from modules.topic_store import get_export_file, release_pages, write_topic
+from modules.ulog_reader import UlogReader
+
+# number of samples per chunk when a topic is processed in chunks
+default_chunk_size = 65536
+
+
+def get_reader_module(reader):
+    """Readers are declared by their module (message_name, required_fields, figure_title)."""
+    return sys.modules[reader.__module__]
+
+
+def get_topic_fields(required_fields: dict, message_name: str):
+    """This function returns the fields of a topic which are decoded, None for all fields. The timestamp is always
+    kept, it is needed to slice the topic."""
+    if required_fields is None:
+        return None
+
+    return ["timestamp"] + [field for field in required_fields[message_name] if field != "timestamp"]
+
+
+def get_required_fields(readers: list) -> dict[str, list[str]]:
+    """This function collects the topics and fields declared by the modules of the given readers. Modules which read
+    several topics declare required_topics = {message_name: fields} instead of message_name and required_fields."""
+    required_fields = {}
+
+    for reader in readers:
+        module = get_reader_module(reader)
+        if hasattr(module, "required_topics"):
+            required_topics = module.required_topics
+        else:
+            required_topics = {module.message_name: module.required_fields}
+
+        for message_name, module_fields in required_topics.items():
+            fields = required_fields.setdefault(message_name, [])
+            fields.extend(field for field in module_fields if field not in fields)
+
+    return required_fields
+
+
+class TopicSource:
+    """Provides the decoded topics of a ulog file as pandas DataFrames."""
+
+    def __init__(self, datasets: dict[tuple[str, int], dict[str, np.ndarray]], required_fields: dict = None):
+        # {(message_name, multi_id): {field: column}}
+        self.datasets = datasets
+        self.required_fields = required_fields
+
+    @classmethod
+    def from_ulog(cls, ulog: ULog, required_fields: dict = None):
+        datasets = {}
+        for data in ulog.data_list:
+            fields = get_topic_fields(required_fields, data.name)
+            datasets[(data.name, data.multi_id)] = {
+                field: column for field, column in data.data.items() if fields is None or field in fields
+            }
+
+        return cls(datasets, required_fields)
+
+    @classmethod
+    def from_ulog_reader(
+        cls, reader: UlogReader, required_fields: dict = None, start_us: int = None, end_us: int = None
+    ):
+        """This function decodes only the required fields of the required topics (all topics if required_fields is
+        None), optionally only the samples between start_us and end_us."""
+        message_names = None if required_fields is None else list(required_fields.keys())
+        with span("decode topics"):
+            return cls(
+                {
+                    key: reader.read_topic(*key, start_us, end_us, get_topic_fields(required_fields, key[0]))
+                    for key in reader.get_topics(message_names)
+                },
+                required_fields,
+            )
+
+    def get_multi_id_num(self, message_name: str):
+        return len([name for name, _ in self.datasets.keys() if name == message_name])
+
+    def get_dataset(self, message_name: str, multi_id: int = 0):
+        if (message_name, multi_id) not in self.datasets:
+            raise ValueError(f"Topic {message_name} {multi_id} not found")
+
+        return self.datasets[(message_name, multi_id)]
+
+    def get_sample_count(self, message_name: str, multi_id: int = 0):
+        data = self.get_dataset(message_name, multi_id)
+        return len(next(iter(data.values()))) if len(data) > 0 else 0
+
+    def get_log_time_range(self):
+        """This function returns the first and the last boot timestamp of all topics."""
+        timestamps = [data["timestamp"] for data in self.datasets.values() if len(data.get("timestamp", [])) > 0]
+        if len(timestamps) == 0:
+            raise Exception("The log has no samples")
+
+        return min(int(column[0]) for column in timestamps), max(int(column[-1]) for column in timestamps)
+
+    def slice(self, start_us: int, end_us: int):
+        """This function returns a TopicSource with only the samples between start_us and end_us (boot timestamps).
+        The bounds are found by a binary search of the sorted timestamps. Slices of cached (memory mapped) topics are
+        views, so only the pages of the window are ever read from disk."""
+        datasets = {}
+        for key, data in self.datasets.items():
+            if "timestamp" not in data:
+                datasets[key] = data
+                continue
+
+            # the timestamps are unsigned
+            start = np.searchsorted(data["timestamp"], max(start_us, 0), side="left")
+            end = np.searchsorted(data["timestamp"], max(end_us, 0), side="right")
+
+            # empty data sets are kept, so the multi_id of the other data sets doesn't change
+            datasets[key] = {field: column[start:end] for field, column in data.items()}
+
+        return TopicSource(datasets, self.required_fields)
+
+    def iter_chunks(self, message_name: str, multi_id: int = 0, fields: list[str] = None, chunk_size: int = None):
+        """This function yields the topic in chunks of chunk_size samples: {field: column slice}. Slices of cached
+        (memory mapped) topics are only read from disk when they are used and released after each chunk."""
+        data = self.get_dataset(message_name, multi_id)
+        fields = fields or list(data.keys())
+        chunk_size = chunk_size or default_chunk_size
+
+        sample_count = len(data[fields[0]])
+        for start in range(0, sample_count, chunk_size):
+            yield {field: data[field][start : start + chunk_size] for field in fields}
+
+            # keep the resident memory flat when iterating over memory mapped topics
+            for field in fields:
+                release_pages(data[field])
+
+    def select(self, message_names: list[str]):
+        """This function returns a TopicSource with only the given topics, e.g. to send it to another process."""
+        return TopicSource(
+            {key: data for key, data in self.datasets.items() if key[0] in message_names}, self.required_fields
+        )
+
+    def get_data_frame(self, message_name: str, multi_id: int = 0):
+        """This function builds a DataFrame straight from the decoded topic columns. The DataFrame shares their memory
+        and keeps the ulog field types (e.g. float32, uint8), so it must not be modified in place."""
+        data = self.get_dataset(message_name, multi_id)
+
+        if self.required_fields is None or message_name not in self.required_fields:
+            return pd.DataFrame(data, copy=False)
+
+        # optional fields (e.g. only present on some vehicles) are skipped if they aren't logged
+        return pd.DataFrame(
+            {field: data[field] for field in self.required_fields[message_name] if field in data}, copy=False
+        )
+
+    def export_topics(self, dirname: str, ulog_filename: str, topic_format: str = "csv"):
+        """This function exports every decoded topic (same naming as ulog2csv)."""
+        os.makedirs(dirname, exist_ok=True)
+
+        for (message_name, multi_id), data in self.datasets.items():
+            write_topic(
+                get_export_file(dirname, ulog_filename, message_name, multi_id, topic_format), data, topic_format
+            )
+
+        logging.info(f"{topic_format.upper()} files: {dirname}")
+
+
+def load_topic_source(
+    ulog_filename: str,
+    required_fields: dict[str, list[str]],
+    cache_dir: str = None,
+    cache_size_mb: int = topic_cache.default_cache_size_mb,
+    index_dir: str = None,
+):
+    """This function loads the required topics from the topic cache or parses the log file on a cache miss.
+    Passing no cache_dir disables the cache. The message offset index of the log file is kept in index_dir."""
+    message_names = list(required_fields.keys())
+
+    if cache_dir is not None:
+        with span("load topic cache"):
+            datasets = topic_cache.load_topics(ulog_filename, required_fields, cache_dir)
+        if datasets is not None:
+            return TopicSource(datasets, required_fields)
+
+    try:
+        with UlogReader(ulog_filename, index_dir) as reader:
+            if cache_dir is not None:
+                # the topics are decoded straight into the cache chunk by chunk and memory mapped from there, so they
+                # are never in memory as a whole
+                topics = {
+                    key: (
+                        reader.get_sample_count(*key),
+                        reader.iter_topic_chunks(*key, get_topic_fields(required_fields, key[0])),
+                    )
+                    for key in reader.get_topics(message_names)
+                }
+                with span("decode topics"):
+                    datasets = write_topic_cache(ulog_filename, required_fields, topics, cache_dir, cache_size_mb)
+                if datasets is not None:
+                    return TopicSource(datasets, required_fields)
+
+            return TopicSource.from_ulog_reader(reader, required_fields)
+    except Exception as e:
+        # pyulog recovers from more kinds of corrupt logs
+        logging.warning(f"Reading {ulog_filename} failed ({e}), parsing it with pyulog")
+        with span("pyulog"):
+            topic_source = TopicSource.from_ulog(ULog(ulog_filename, message_names, True), required_fields)
+
+    if cache_dir is not None:
+        topics = {key: (topic_source.get_sample_count(*key), [data]) for key, data in topic_source.datasets.items()}
+        write_topic_cache(ulog_filename, required_fields, topics, cache_dir, cache_size_mb)
+
+    return topic_source
+
+
+def write_topic_cache(
+    ulog_filename: str, required_fields: dict[str, list[str]], topics: dict, cache_dir: str, cache_size_mb: int
+):
+    """This function writes the topics ({key: (sample count, chunks)}) into the topic cache and returns them memory
+    mapped from there, None if the cache can't be written."""
+    with span("write topic cache"):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            entry_dirname = topic_cache.write_topics(ulog_filename, required_fields, topics, cache_dir)
+            topic_cache.evict_entries(cache_dir, cache_size_mb, keep_dirname=entry_dirname)
+        except OSError as e:
+            # e.g. read-only log directory, the log is loaded anyway
+            logging.warning(f"Couldn't write topic cache {cache_dir}: {e}")
+            return None
+
+    return topic_cache.load_topics(ulog_filename, required_fields, cache_dir)
+
+
+def load_log(
+    ulog_filename: str,
+    readers: list,
+    use_cache: bool = True,
+    cache_dir: str = None,
+    cache_size_mb: int = topic_cache.default_cache_size_mb,
+    start: str = None,
+    end: str = None,
+):
+    """This function loads the topics the readers (and the time base and the flight events) need, only the
+    --start/--end time range if given, and fits the time base. Returns (topic source, time base, (start_us, end_us)
+    or None)."""
+    # these modules build on this one
+    from modules.flight_events import get_event_timestamp
+    from modules.timestamp_helper import get_time_base, load_time_range
+
+    # the message offset index of the log is also kept if the topic cache is disabled
+    index_dir = cache_dir or topic_cache.get_default_cache_dir(ulog_filename)
+    cache_dir = index_dir if use_cache else None
+
+    # all callers load the same fields, so they share one topic cache entry per log
+    required_fields = get_required_fields(readers + [get_time_base, get_event_timestamp])
+
+    if start is None and end is None:
+        topic_source = load_topic_source(ulog_filename, required_fields, cache_dir, cache_size_mb, index_dir)
+        return topic_source, get_time_base(topic_source), None
+
+    # the time base is fitted from the whole log
+    return load_time_range(ulog_filename, required_fields, start, end, cache_dir, cache_size_mb, index_dir)
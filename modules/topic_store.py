@@ -0,0 +1,108 @@
+import copyreg
+import mmap
+import os
+import numpy as np
+import pandas as pd
+
+# npy keeps the exact ulog field types (e.g. uint64 timestamps) and can be memory mapped, csv is for exports only
+topic_formats = ["npy", "csv"]
+
+
+def get_topic_file(dirname: str, message_name: str, multi_id: int, topic_format: str = "npy", prefix: str = ""):
+    return os.path.join(dirname, f"{prefix}{message_name}_{multi_id}.{topic_format}")
+
+
+def get_export_file(dirname: str, ulog_filename: str, message_name: str, multi_id: int, topic_format: str):
+    """This function returns the same file names as ulog2csv: <log name>_<message name>_<multi id>.<format>"""
+    output_file_prefix = ulog_filename
+
+    # strip '.ulg'
+    if output_file_prefix.lower().endswith(".ulg"):
+        output_file_prefix = output_file_prefix[:-4]
+
+    base_name = os.path.basename(output_file_prefix)
+    return get_topic_file(dirname, message_name, multi_id, topic_format, prefix=f"{base_name}_")
+
+
+def write_topic(filename: str, columns: dict[str, np.ndarray], topic_format: str = "npy"):
+    if topic_format == "csv":
+        pd.DataFrame(columns).to_csv(filename, index=False)
+        return
+
+    if topic_format != "npy":
+        raise Exception(f"Unknown topic format {topic_format}")
+
+    write_topic_chunks(filename, [columns], len(next(iter(columns.values()))))
+
+
+def write_topic_chunks(filename: str, chunks, sample_count: int):
+    """This function stores a topic of sample_count samples which is passed in chunks ({field: column}, e.g. from
+    UlogReader.iter_topic_chunks) as npy file. The file is written through a memory map whose pages are released
+    after every chunk, so the topic is never in memory as a whole."""
+    topic = None
+    count = 0
+
+    for chunk in chunks:
+        if topic is None:
+            # store the columns one after another with the original field types, so a memory mapped column is
+            # contiguous and using it only reads its own pages
+            dtype = np.dtype([(field, column.dtype, (sample_count,)) for field, column in chunk.items()])
+            if dtype.itemsize == 0:
+                # an empty file can't be memory mapped
+                np.save(filename, np.empty((), dtype=dtype))
+                return
+            topic = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=())
+
+        chunk_size = len(next(iter(chunk.values())))
+        for field, column in chunk.items():
+            topic[field][count : count + chunk_size] = column
+            release_pages(topic[field])
+        count += chunk_size
+
+    if topic is None:
+        raise Exception(f"No chunks for {filename}")
+    if count != sample_count:
+        raise Exception(f"Got {count} instead of {sample_count} samples for {filename}")
+
+    topic.flush()
+
+
+def read_topic(filename: str):
+    """This function memory maps a stored topic, the returned columns are views into the file (no copies)."""
+    if not filename.endswith(".npy"):
+        raise Exception(f"Can't read topic file {filename}")
+
+    topic = np.load(filename, mmap_mode="r")
+    return {field: topic[field] for field in topic.dtype.names}
+
+
+def release_pages(column: np.ndarray):
+    """This function drops the pages of a memory mapped topic from the resident memory, e.g. after a chunk has been
+    processed. They are read from the page cache again when they are used."""
+    mapping = getattr(column, "_mmap", None)
+    if mapping is not None and hasattr(mmap, "MADV_DONTNEED"):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+
+def open_column(filename: str, dtype: np.dtype, offset: int, shape: tuple):
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def reduce_column(column: np.memmap):
+    """This function pickles a read-only memory mapped column as a reference to its file instead of its data, e.g.
+    when topics are sent to worker processes and figures with their full resolution traces are sent back. Other
+    memmaps are pickled as arrays."""
+    if column._mmap is None or column.mode != "r" or column.size == 0 or not column.flags.c_contiguous:
+        return np.asarray(column).__reduce__()
+
+    # the mapping starts at the offset of the memmap rounded down to the allocation granularity
+    mapping_bytes = np.frombuffer(column._mmap, dtype=np.uint8)
+    offset = (
+        column.ctypes.data - mapping_bytes.ctypes.data + column.offset - column.offset % mmap.ALLOCATIONGRANULARITY
+    )
+    del mapping_bytes
+
+    return open_column, (column.filename, column.dtype, offset, column.shape)
+
+
+copyreg.pickle(np.memmap, reduce_column)
@@ -0,0 +1,195 @@
+import re
+import uuid
+import numpy as np
+import plotly.graph_objects as go
+
+from modules.timestamp_helper import TimeBase
+from modules.topic_store import release_pages
+
+# traces of signals with more samples than this are rendered with WebGL instead of SVG. This is decided on the full
+# resolution data, so decimated traces (fewer points than target_point_count) are rendered with WebGL as well
+webgl_point_threshold = 10000
+
+# number of points per trace sent to the browser, use 0 to disable the decimation
+target_point_count = 4000
+
+# number of samples of a trace which are searched for their minimum and maximum at once
+decimation_chunk_size = 65536
+
+# full resolution data of all decimated traces: {trace uid: (x, y, time_base)}
+full_resolution_traces = {}
+
+
+def get_min_max_indices(y: np.ndarray, point_count: int):
+    """This function splits y into point_count / 2 buckets and returns the indices of the minimum and maximum
+    of each bucket (plus the first and last index). This keeps peaks and short spikes visible. The buckets are
+    processed in chunks of about decimation_chunk_size samples, so memory mapped topics are never resident as a
+    whole."""
+    bucket_count = max(point_count // 2, 1)
+    bucket_size = int(np.ceil(len(y) / bucket_count))
+    chunk_size = max(decimation_chunk_size // bucket_size, 1) * bucket_size
+
+    index_parts = [[0, len(y) - 1]]
+    for chunk_start in range(0, len(y), chunk_size):
+        chunk = y[chunk_start : chunk_start + chunk_size]
+
+        # NaNs must neither be selected as minimum nor as maximum, only float chunks are copied to replace them
+        min_values = max_values = chunk
+        if chunk.dtype.kind == "f":
+            nan_mask = np.isnan(chunk)
+            if nan_mask.any():
+                min_values = np.where(nan_mask, np.inf, chunk)
+                max_values = np.where(nan_mask, -np.inf, chunk)
+
+        # the full buckets are reshaped without copying, the last bucket may be shorter
+        full_size = len(chunk) // bucket_size * bucket_size
+        bucket_offsets = chunk_start + np.arange(0, full_size, bucket_size)
+        index_parts.append(bucket_offsets + np.argmin(min_values[:full_size].reshape(-1, bucket_size), axis=1))
+        index_parts.append(bucket_offsets + np.argmax(max_values[:full_size].reshape(-1, bucket_size), axis=1))
+        if full_size < len(chunk):
+            index_parts.append(
+                [
+                    chunk_start + full_size + np.argmin(min_values[full_size:]),
+                    chunk_start + full_size + np.argmax(max_values[full_size:]),
+                ]
+            )
+
+        release_pages(y)
+
+    # sorted and without duplicates
+    return np.unique(np.concatenate(index_parts))
+
+
+def decimate(x: np.ndarray, y: np.ndarray, point_count: int = None):
+    if point_count is None:
+        point_count = target_point_count
+
+    if point_count <= 0 or len(y) <= point_count:
+        return x, y
+
+    indices = get_min_max_indices(y, point_count)
+    return x[indices], y[indices]
+
+
+def to_plot_x(x: np.ndarray, time_base: TimeBase):
+    return x if time_base is None else time_base.to_datetime(x)
+
+
+def get_scatter_properties(x, y, name: str, time_base: TimeBase = None, **kwargs):
+    """This function returns the properties of a line trace as dict, e.g. to create all traces of a figure at once
+    with go.Figure(data=[...]). If a time_base is given, x are boot timestamps which are only converted to datetimes
+    after the decimation. Long traces are decimated and rendered with WebGL, their full resolution data is kept in
+    full_resolution_traces."""
+    # keeps memory mapped topic columns memory mapped, see get_min_max_indices
+    x = np.asanyarray(x)
+    y = np.asanyarray(y)
+
+    if time_base is not None:
+        # the timestamps are below 2^63, a view keeps the traces of a topic sharing one timestamp column
+        x = x.view(np.int64) if x.dtype == np.uint64 else x.astype(np.int64, copy=False)
+
+    uid = uuid.uuid4().hex
+    if target_point_count > 0 and len(y) > target_point_count:
+        full_resolution_traces[uid] = (x, y, time_base)
+
+    x_plot, y_plot = decimate(x, y)
+
+    scatter_type = "scattergl" if len(y) > webgl_point_threshold else "scatter"
+    return dict(
+        type=scatter_type, x=to_plot_x(x_plot, time_base), y=y_plot, mode="lines", name=name, uid=uid, **kwargs
+    )
+
+
+def make_scatter(x, y, name: str, time_base: TimeBase = None, **kwargs):
+    """This function creates a line trace, see get_scatter_properties."""
+    properties = get_scatter_properties(x, y, name, time_base, **kwargs)
+    scatter_type = go.Scattergl if properties.pop("type") == "scattergl" else go.Scatter
+    return scatter_type(**properties)
+
+
+def release_figure(fig: go.Figure):
+    """This function drops the full resolution data of the traces of a figure that isn't used anymore."""
+    for trace in fig.data:
+        full_resolution_traces.pop(trace.uid, None)
+
+
+def pop_full_resolution_traces(fig: go.Figure):
+    """This function removes and returns the full resolution data of the traces of a figure, e.g. to send it from a
+    worker process to the process that serves the figure."""
+    return {
+        trace.uid: full_resolution_traces.pop(trace.uid) for trace in fig.data if trace.uid in full_resolution_traces
+    }
+
+
+def get_x_ranges(relayout_data: dict):
+    """This function extracts the changed x axis ranges of a relayoutData event: {axis: (start, end)}.
+    A range of None means the axis was reset (autorange)."""
+    x_ranges = {}
+
+    for key, value in relayout_data.items():
+        match = re.fullmatch(r"xaxis(\d*)\.(range\[0\]|range\[1\]|range|autorange)", key)
+        if match is None:
+            continue
+
+        axis = f"x{match.group(1)}"
+        if match.group(2) == "autorange":
+            x_ranges[axis] = None
+        elif match.group(2) == "range":
+            x_ranges[axis] = tuple(value)
+        else:
+            start, end = x_ranges.get(axis) or (None, None)
+            x_ranges[axis] = (value, end) if match.group(2) == "range[0]" else (start, value)
+
+    return x_ranges
+
+
+def to_x_value(value, time_base: TimeBase):
+    """This function converts a range value of plotly (number or date string) to the unit of the full resolution x."""
+    if time_base is not None and time_base.has_gps_time():
+        if not isinstance(value, str):
+            raise ValueError(f"{value} is not a date")
+        return time_base.to_timestamp_us(np.datetime64(value.replace(" ", "T")))
+    return float(value)
+
+
+def resample_traces(fig: go.Figure, relayout_data: dict):
+    """This function decimates the visible window of every decimated trace of the zoomed x axes again, so the number
+    of points stays the same for every zoom level. Returns {trace index: (x, y)}."""
+    x_ranges = get_x_ranges(relayout_data)
+
+    # subplots with shared x axes all zoom together
+    def get_axis_group(axis):
+        layout_axis = fig.layout[axis.replace("x", "xaxis", 1)]
+        return layout_axis.matches or axis
+
+    x_ranges = {get_axis_group(axis): x_range for axis, x_range in x_ranges.items()}
+
+    resampled_traces = {}
+    for index, trace in enumerate(fig.data):
+        axis_group = get_axis_group(trace.xaxis or "x")
+        if trace.uid not in full_resolution_traces or axis_group not in x_ranges:
+            continue
+
+        x, y, time_base = full_resolution_traces[trace.uid]
+
+        x_range = x_ranges[axis_group]
+        if x_range is None or None in x_range:
+            x_plot, y_plot = decimate(x, y)
+            resampled_traces[index] = (to_plot_x(x_plot, time_base), y_plot)
+            continue
+
+        try:
+            x_start, x_end = to_x_value(x_range[0], time_base), to_x_value(x_range[1], time_base)
+        except ValueError:
+            # e.g. time and frequency subplots sharing their x axes
+            continue
+
+        # include one point outside of the window on each side so the lines reach the plot borders
+        start, end = np.searchsorted(x, [x_start, x_end])
+        start = max(start - 1, 0)
+        end = min(end + 1, len(x))
+
+        x_plot, y_plot = decimate(x[start:end], y[start:end])
+        resampled_traces[index] = (to_plot_x(x_plot, time_base), y_plot)
+
+    return resampled_traces
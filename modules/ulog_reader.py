@@ -0,0 +1,502 @@
+import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import numpy as np
+
+from modules.instrumentation import span
+from modules.topic_cache import get_log_key
+
+header_bytes = b"\x55\x4c\x6f\x67\x01\x12\x35"
+header_size = 16
+
+# written by the logger so a reader can recover from corrupt data
+sync_bytes = b"\x2f\x73\x13\x20\x25\x0c\xbb\x12"
+
+# {ulog type: numpy type}, the same types as pyulog
+field_types = {
+    "int8_t": np.int8,
+    "uint8_t": np.uint8,
+    "int16_t": np.int16,
+    "uint16_t": np.uint16,
+    "int32_t": np.int32,
+    "uint32_t": np.uint32,
+    "int64_t": np.int64,
+    "uint64_t": np.uint64,
+    "float": np.float32,
+    "double": np.float64,
+    "bool": np.int8,
+    "char": np.int8,
+}
+
+message_types = {ord(message_type) for message_type in "FDIMPQARSOLCB"}
+
+# header of every message: size of the payload, message type and (for data messages) the msg_id
+message_header = struct.Struct("<HBH")
+
+# number of bytes gathered from the mapped file at once when a topic is decoded
+gather_chunk_size = 4 * 1024 * 1024
+
+# maximum distance in the file of the records which are gathered at once
+gather_span_size = 16 * 1024 * 1024
+
+# number of bytes scanned before the data messages are grouped by msg_id and the pages of the mapped file are released
+scan_block_size = 16 * 1024 * 1024
+
+# number of values read at sparse offsets before the pages of the mapped file are released
+sparse_read_count = 16
+
+# bump this whenever the layout of the index files changes, older index files are rewritten then
+index_version = 1
+
+# the first and the last timestamp of every block of this many data messages are indexed
+index_block_size = 4096
+
+
+def get_index_filename(index_dirname: str, ulog_filename: str):
+    path_hash = hashlib.blake2b(os.path.abspath(ulog_filename).encode(), digest_size=8).hexdigest()
+    base_name = os.path.splitext(os.path.basename(ulog_filename))[0]
+    return os.path.join(index_dirname, f"{base_name}-{path_hash}.index.npz")
+
+
+def parse_format(payload: bytes):
+    """This function parses a format message "name:type field;type[n] field;..." into
+    (name, [(type, array size (0 for no array), field name)])."""
+    name, fields = payload.decode("utf-8", errors="replace").rstrip("\0").split(":", 1)
+
+    parsed_fields = []
+    for field in fields.split(";"):
+        if len(field) == 0:
+            continue
+
+        field_type, field_name = field.split(" ", 1)
+        if "[" in field_type:
+            field_type, array_size = field_type.rstrip("]").split("[")
+            parsed_fields.append((field_type, int(array_size), field_name))
+        else:
+            parsed_fields.append((field_type, 0, field_name))
+
+    return name, parsed_fields
+
+
+class UlogReader:
+    """Random access reader of the data of a ulog file. The file is memory mapped and the message headers are scanned
+    once to index the offsets of the data messages of every subscription. A topic is then decoded straight from the
+    mapped file into a structured array, without a Python object per message, so decoding a topic only costs time
+    proportional to its bytes. Use pyulog for the other contents of the log (parameters, logged messages, ...).
+
+    If an index_dirname is given, the index is stored there as sidecar file and the scan is skipped when the log is
+    opened again."""
+
+    def __init__(self, ulog_filename: str, index_dirname: str = None):
+        self.ulog_filename = ulog_filename
+
+        with open(ulog_filename, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[: len(header_bytes)] != header_bytes:
+            self.close()
+            raise Exception(f"{ulog_filename} is no ulog file")
+
+        # {format name: [(type, array size, field name)]}
+        self.formats = {}
+        # {msg_id: (message_name, multi_id)}
+        self.subscriptions = {}
+        # {msg_id: payload offsets of the data messages, without the msg_id}
+        self.data_offsets = {}
+        # {msg_id: first and last timestamp of every index block, shape (blocks, 2)}
+        self.block_timestamps = {}
+        self.appended_offsets = []
+
+        if index_dirname is None:
+            with span("scan log"):
+                self.scan()
+            return
+
+        index_filename = get_index_filename(index_dirname, ulog_filename)
+        with span("read index"):
+            index_read = self.read_index(index_filename)
+        if not index_read:
+            with span("scan log"):
+                self.scan()
+            self.write_index(index_filename)
+
+    def close(self):
+        self.buffer.close()
+
+    def release_pages(self):
+        """This function drops the pages of the mapped file from the resident memory, they are read from the page
+        cache again when they are used."""
+        if hasattr(mmap, "MADV_DONTNEED"):
+            self.buffer.madvise(mmap.MADV_DONTNEED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def parse_flag_bits(self, payload: bytes):
+        incompat_flags = payload[8:16]
+        # only the "data appended" flag is known
+        if incompat_flags[0] & ~1 or any(incompat_flags[1:]):
+            raise Exception(f"Unknown incompatible flag set in {self.ulog_filename}")
+
+        if incompat_flags[0] & 1:
+            self.appended_offsets = [offset for offset in struct.unpack_from("<3Q", payload, 16) if offset != 0]
+
+    def scan(self):
+        """This function walks over the message headers once. The data section may be split by appended data, every
+        section is read up to the start of the next one."""
+        # {msg_id: [payload offsets of the data messages of every scanned block]}
+        offset_blocks = {}
+        # {msg_id: number of corrupt messages}
+        corrupt_counts = {}
+
+        # the flag bits message (the first message) declares the appended sections
+        self.scan_section(header_size, len(self.buffer), offset_blocks, corrupt_counts)
+        for section_num, section_start in enumerate(self.appended_offsets):
+            if section_num + 1 < len(self.appended_offsets):
+                section_end = self.appended_offsets[section_num + 1]
+            else:
+                section_end = len(self.buffer)
+            self.scan_section(section_start, section_end, offset_blocks, corrupt_counts)
+
+        for msg_id, corrupt_count in corrupt_counts.items():
+            logging.warning(f"Skipping {corrupt_count} corrupt {self.subscriptions[msg_id][0]} messages")
+
+        for msg_id in sorted(offset_blocks.keys()):
+            offsets = np.concatenate(offset_blocks.pop(msg_id))
+
+            if msg_id in self.subscriptions and self.subscriptions[msg_id][0] in self.formats:
+                dtype = self.get_dtype(self.subscriptions[msg_id][0])
+                if "timestamp" in dtype.names and len(offsets) > 0:
+                    self.block_timestamps[msg_id] = self.get_block_timestamps(offsets, dtype.fields["timestamp"][1])
+
+            self.data_offsets[msg_id] = offsets
+
+        self.release_pages()
+
+    def add_offset_block(
+        self,
+        msg_ids: array.array,
+        offsets: array.array,
+        sizes: array.array,
+        offset_blocks: dict,
+        corrupt_counts: dict,
+    ):
+        """This function groups a block of scanned data messages by msg_id, in file order. Only the offsets are kept,
+        so the memory needed by the scan grows by 8 bytes per message."""
+        msg_ids = np.frombuffer(msg_ids, dtype=np.uint16)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        sizes = np.frombuffer(sizes, dtype=np.int32)
+
+        for msg_id in np.unique(msg_ids):
+            msg_id = int(msg_id)
+            selected = msg_ids == msg_id
+            selected_offsets = offsets[selected]
+
+            if msg_id in self.subscriptions and self.subscriptions[msg_id][0] in self.formats:
+                # shorter messages are corrupt, longer ones contain padding
+                valid = sizes[selected] >= self.get_dtype(self.subscriptions[msg_id][0]).itemsize
+                if not np.all(valid):
+                    corrupt_counts[msg_id] = corrupt_counts.get(msg_id, 0) + np.count_nonzero(~valid)
+                    selected_offsets = selected_offsets[valid]
+
+            offset_blocks.setdefault(msg_id, []).append(selected_offsets)
+
+    def read_uint64(self, offsets: np.ndarray):
+        """This function reads the values at sparse offsets, e.g. the timestamps at the index block boundaries. Every
+        value may map a whole (large) page of the file, so the pages are released every sparse_read_count values."""
+        file_bytes = np.frombuffer(self.buffer, dtype=np.uint8)
+        values = np.empty(len(offsets), dtype=np.uint64)
+        for start in range(0, len(offsets), sparse_read_count):
+            chunk_offsets = offsets[start : start + sparse_read_count]
+            values[start : start + len(chunk_offsets)] = (
+                file_bytes[chunk_offsets[:, None] + np.arange(8)].copy().view("<u8")[:, 0]
+            )
+            self.release_pages()
+        del file_bytes
+        return values
+
+    def get_block_timestamps(self, offsets: np.ndarray, timestamp_offset: int):
+        """This function reads the first and the last timestamp of every block of index_block_size messages."""
+        first_offsets = offsets[::index_block_size]
+        last_offsets = offsets[
+            np.minimum(np.arange(len(first_offsets)) * index_block_size + index_block_size - 1, len(offsets) - 1)
+        ]
+        return np.stack(
+            (self.read_uint64(first_offsets + timestamp_offset), self.read_uint64(last_offsets + timestamp_offset)),
+            axis=1,
+        )
+
+    def read_index(self, index_filename: str):
+        """This function loads the index of a sidecar file, returns False if there is none or it is outdated."""
+        try:
+            with np.load(index_filename) as index:
+                header = json.loads(str(index["header"]))
+                if header["version"] != index_version or header["log_key"] != get_log_key(self.ulog_filename):
+                    logging.info(f"Discarding outdated index {index_filename}")
+                    return False
+
+                self.formats = {name: [tuple(field) for field in fields] for name, fields in header["formats"].items()}
+                self.subscriptions = {int(msg_id): tuple(topic) for msg_id, topic in header["subscriptions"].items()}
+                self.appended_offsets = header["appended_offsets"]
+
+                for msg_id in header["msg_ids"]:
+                    # the offsets are stored as differences, which compress well
+                    self.data_offsets[msg_id] = np.cumsum(index[f"offset_steps_{msg_id}"])
+                    if f"block_timestamps_{msg_id}" in index:
+                        self.block_timestamps[msg_id] = index[f"block_timestamps_{msg_id}"]
+        except (OSError, ValueError, KeyError):
+            return False
+
+        logging.info(f"Loaded index {index_filename}")
+        return True
+
+    def write_index(self, index_filename: str):
+        header = {
+            "version": index_version,
+            "log_key": get_log_key(self.ulog_filename),
+            "formats": self.formats,
+            "subscriptions": self.subscriptions,
+            "appended_offsets": self.appended_offsets,
+            "msg_ids": list(self.data_offsets.keys()),
+        }
+        arrays = {
+            f"offset_steps_{msg_id}": np.diff(offsets, prepend=0) for msg_id, offsets in self.data_offsets.items()
+        }
+        arrays.update(
+            {f"block_timestamps_{msg_id}": timestamps for msg_id, timestamps in self.block_timestamps.items()}
+        )
+
+        # write into a temporary file first so that aborted writes never look like valid index files
+        tmp_index_filename = f"{index_filename}.tmp{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(index_filename), exist_ok=True)
+            with open(tmp_index_filename, "wb") as file:
+                np.savez_compressed(file, header=json.dumps(header), **arrays)
+            os.replace(tmp_index_filename, index_filename)
+        except OSError as e:
+            # e.g. a read-only log directory, the log is just scanned again next time
+            logging.warning(f"Couldn't write index {index_filename}: {e}")
+
+    def scan_section(self, start: int, section_end: int, offset_blocks: dict, corrupt_counts: dict):
+        # this loop runs once per message, so it only does the bare minimum for data messages. They are collected in
+        # typed arrays (a fraction of the memory of lists of ints) and grouped every scan_block_size bytes
+        buffer = self.buffer
+        unpack_header = message_header.unpack_from
+        msg_ids, offsets, sizes = array.array("H"), array.array("q"), array.array("i")
+        append_msg_id, append_offset, append_size = msg_ids.append, offsets.append, sizes.append
+        block_end = start + scan_block_size
+        data_type = ord("D")
+        # the last message may be too short for the full header
+        full_header_end = len(buffer) - message_header.size
+
+        position = start
+        while position + 3 <= section_end:
+            if position <= full_header_end:
+                size, message_type, msg_id = unpack_header(buffer, position)
+            else:
+                size, message_type = struct.unpack_from("<HB", buffer, position)
+
+            payload_start = position + 3
+            position = payload_start + size
+
+            # the log was cut
+            if position > section_end:
+                break
+
+            if message_type == data_type:
+                append_msg_id(msg_id)
+                append_offset(payload_start + 2)
+                append_size(size - 2)
+
+                if position > block_end:
+                    self.add_offset_block(msg_ids, offsets, sizes, offset_blocks, corrupt_counts)
+                    msg_ids, offsets, sizes = array.array("H"), array.array("q"), array.array("i")
+                    append_msg_id, append_offset, append_size = msg_ids.append, offsets.append, sizes.append
+                    # the scanned pages of the mapped file aren't needed anymore
+                    self.release_pages()
+                    block_end = position + scan_block_size
+            elif message_type == ord("A"):
+                multi_id, msg_id = struct.unpack_from("<BH", buffer, payload_start)
+                message_name = buffer[payload_start + 3 : position].decode("utf-8", errors="replace").rstrip("\0")
+                self.subscriptions[msg_id] = (message_name, multi_id)
+            elif message_type == ord("F"):
+                name, fields = parse_format(buffer[payload_start:position])
+                self.formats[name] = fields
+            elif message_type == ord("B"):
+                self.parse_flag_bits(buffer[payload_start:position])
+                if len(self.appended_offsets) > 0:
+                    section_end = min(section_end, self.appended_offsets[0])
+            elif message_type not in message_types:
+                # corrupt data, continue after the next sync sequence
+                sync_position = buffer.find(sync_bytes, payload_start - 2, section_end)
+                if sync_position < 0:
+                    logging.warning(f"Corrupt data in {self.ulog_filename} at offset {payload_start - 3}")
+                    break
+                logging.warning(f"Skipped corrupt data in {self.ulog_filename} at offset {payload_start - 3}")
+                position = sync_position + len(sync_bytes)
+
+        self.add_offset_block(msg_ids, offsets, sizes, offset_blocks, corrupt_counts)
+
+    def get_fields(self, type_name: str, prefix: str = ""):
+        """This function flattens a format into [(field name, numpy type)], named like pyulog (e.g.
+        esc[0].esc_rpm, accelerometer_m_s2[2])."""
+        fields = []
+        for field_type, array_size, field_name in self.formats[type_name]:
+            names = [f"{field_name}[{x}]" for x in range(array_size)] if array_size > 0 else [field_name]
+            for name in names:
+                if field_type in field_types:
+                    fields.append((prefix + name, field_types[field_type]))
+                else:
+                    fields.extend(self.get_fields(field_type, f"{prefix}{name}."))
+
+        return fields
+
+    def get_dtype(self, message_name: str):
+        fields = self.get_fields(message_name)
+
+        # padding at the end isn't logged
+        while len(fields) > 0 and fields[-1][0].startswith("_padding"):
+            fields.pop()
+
+        return np.dtype(fields).newbyteorder("<")
+
+    def get_topics(self, message_names: list[str] = None):
+        """This function returns the (message_name, multi_id) of all topics with data, optionally only the given
+        topics."""
+        return sorted(
+            {
+                self.subscriptions[msg_id]
+                for msg_id in self.data_offsets.keys()
+                if msg_id in self.subscriptions
+                and (message_names is None or self.subscriptions[msg_id][0] in message_names)
+            }
+        )
+
+    def get_msg_ids(self, message_names: list[str]):
+        return [
+            msg_id
+            for msg_id, (message_name, _) in self.subscriptions.items()
+            if msg_id in self.data_offsets and message_name in message_names
+        ]
+
+    def get_time_range(self, message_names: list[str]):
+        """This function returns the first and the last timestamp of the given topics from the index, without
+        decoding them."""
+        block_timestamps = [
+            self.block_timestamps[msg_id]
+            for msg_id in self.get_msg_ids(message_names)
+            if msg_id in self.block_timestamps
+        ]
+        if len(block_timestamps) == 0:
+            raise Exception("The log has no samples")
+
+        return (
+            min(int(timestamps[0, 0]) for timestamps in block_timestamps),
+            max(int(timestamps[-1, 1]) for timestamps in block_timestamps),
+        )
+
+    def get_record_time_range(self, dtype: np.dtype, start_us: int = None, end_us: int = None):
+        """This function returns the (start_us, end_us) the records are cut to, None for all records."""
+        if start_us is None or end_us is None or "timestamp" not in dtype.names:
+            return None
+
+        # the timestamps are unsigned
+        return max(start_us, 0), max(end_us, 0)
+
+    def get_topic_offsets(self, message_name: str, multi_id: int = 0, time_range: tuple = None):
+        """This function returns the payload offsets of the data messages of a topic in file order, only of the index
+        blocks which overlap the time_range (start_us, end_us) if given."""
+        msg_ids = [msg_id for msg_id in self.get_msg_ids([message_name]) if self.subscriptions[msg_id][1] == multi_id]
+        if len(msg_ids) == 0:
+            raise ValueError(f"Topic {message_name} {multi_id} not found")
+
+        data_offsets = []
+        for msg_id in msg_ids:
+            offsets = self.data_offsets[msg_id]
+            # subscriptions whose messages were all skipped as corrupt have no offsets and no block timestamps
+            if time_range is not None and msg_id in self.block_timestamps:
+                block_timestamps = self.block_timestamps[msg_id]
+                blocks = (block_timestamps[:, 1] >= time_range[0]) & (block_timestamps[:, 0] <= time_range[1])
+                offsets = offsets[np.repeat(blocks, index_block_size)[: len(offsets)]]
+            data_offsets.append(offsets)
+
+        if len(data_offsets) == 1:
+            return data_offsets[0]
+
+        # a topic which was subscribed several times is merged in file order
+        return np.sort(np.concatenate(data_offsets), kind="stable")
+
+    def get_sample_count(self, message_name: str, multi_id: int = 0):
+        return len(self.get_topic_offsets(message_name, multi_id))
+
+    def iter_records(self, dtype: np.dtype, offsets: np.ndarray, time_range: tuple = None):
+        """This function gathers the records at the given offsets in chunks of gather_chunk_size bytes and yields them
+        as structured arrays, cut to the time_range if given. The pages of the mapped log file are released after each
+        chunk, so the resident memory doesn't grow with the length of the topic."""
+        record_byte_offsets = np.arange(dtype.itemsize)
+        chunk_size = max(gather_chunk_size // max(dtype.itemsize, 1), 1)
+
+        start = 0
+        while start < len(offsets):
+            # the records of a chunk are also at most gather_span_size bytes apart in the file, the records of rarely
+            # logged topics would otherwise map pages of the whole file at once
+            end = min(start + chunk_size, np.searchsorted(offsets, offsets[start] + gather_span_size))
+            chunk_offsets = offsets[start:end]
+            start = end
+
+            file_bytes = np.frombuffer(self.buffer, dtype=np.uint8)
+            records = file_bytes[chunk_offsets[:, None] + record_byte_offsets].view(dtype)[:, 0]
+            # the mapped file can only be closed once no array refers to it anymore, the records are a copy
+            del file_bytes
+            self.release_pages()
+
+            if time_range is not None:
+                records = records[(records["timestamp"] >= time_range[0]) & (records["timestamp"] <= time_range[1])]
+
+            yield records
+
+    def iter_topic_chunks(self, message_name: str, multi_id: int = 0, fields: list[str] = None):
+        """This function decodes a topic chunk by chunk, e.g. to write it to a file without keeping it in memory:
+        {field: contiguous column} per chunk of gather_chunk_size bytes, at least one (empty) chunk. Only the given
+        fields (default all) are kept."""
+        dtype = self.get_dtype(message_name)
+        # fields which aren't logged (e.g. only present in newer firmware) are skipped
+        fields = [name for name in dtype.names if fields is None or name in fields]
+
+        offsets = self.get_topic_offsets(message_name, multi_id)
+        if len(offsets) == 0:
+            # the field types of an empty topic are still needed
+            yield {field: np.empty(0, dtype=dtype[field]) for field in fields}
+
+        for records in self.iter_records(dtype, offsets):
+            yield {field: np.ascontiguousarray(records[field]) for field in fields}
+
+    def read_topic(
+        self, message_name: str, multi_id: int = 0, start_us: int = None, end_us: int = None, fields: list[str] = None
+    ) -> dict[str, np.ndarray]:
+        """This function decodes the data messages of a topic: {field: column}. The columns are contiguous arrays of
+        the ulog field types, only the given fields (default all) are kept. If start_us and end_us are given, only the
+        index blocks which overlap this time range are decoded and cut to it."""
+        dtype = self.get_dtype(message_name)
+        time_range = self.get_record_time_range(dtype, start_us, end_us)
+        offsets = self.get_topic_offsets(message_name, multi_id, time_range)
+
+        # fields which aren't logged (e.g. only present in newer firmware) are skipped
+        fields = [name for name in dtype.names if fields is None or name in fields]
+        columns = {field: np.empty(len(offsets), dtype=dtype[field]) for field in fields}
+        count = 0
+
+        # only a chunk of whole records is in memory at a time, the requested fields are copied into the columns
+        for records in self.iter_records(dtype, offsets, time_range):
+            for field in fields:
+                columns[field][count : count + len(records)] = records[field]
+            count += len(records)
+
+        return {field: column[:count] for field, column in columns.items()}
@@ -1,92 +1,35 @@
-import logging
-import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
+from modules.figure_spec import render_figure
+from modules.timestamp_helper import TimeBase
+from modules.topic_source import TopicSource
 
-from modules.csv_reader import get_csv_file, get_multi_id_num
-from modules.figure_formatter import format_figure
-from modules.timestamp_helper import fix_timestamps
+message_name = "vehicle_air_data"
 
+figure_title = "Vehicle air data"
 
-def read_vehicle_air_data_data(tmp_dirname: str, ulog_filename: str):
-    message_name = "vehicle_air_data"
+required_fields = ["timestamp", "baro_alt_meter", "baro_temp_celcius", "baro_pressure_pa"]
 
-    dataset_count = get_multi_id_num(tmp_dirname, message_name)
-    logging.info(f"Found {dataset_count} {message_name} data sets")
 
-    timestamp_field = "timestamp"
+# subplots of the figure, see modules/figure_spec.py
+figure_spec = {
+    "timestamp_field": "timestamp",
+    "rows": [
+        {
+            "title": "Barometer altitude",
+            "unit": " m",
+            "traces": [{"field": "baro_alt_meter", "name": "Barometer altitude"}],
+        },
+        {
+            "title": "Barometer temperature",
+            "unit": " °C",
+            "traces": [{"field": "baro_temp_celcius", "name": "Barometer temperature"}],
+        },
+        {"title": "Pressure", "unit": " pa", "traces": [{"field": "baro_pressure_pa", "name": "Barometer pressure"}]},
+    ],
+}
 
-    figs = []
 
-    for dataset_num in range(dataset_count):
-        # read in csv
-        df = pd.read_csv(get_csv_file(tmp_dirname, ulog_filename, message_name, dataset_num))
-        fix_timestamps(df, timestamp_field)
+def read_vehicle_air_data_data(topic_source: TopicSource, time_base: TimeBase, dataset_num: int):
+    # read in topic data
+    df = topic_source.get_data_frame(message_name, dataset_num)
 
-        rows = 3
-        subplot_titles = [
-            "Barometer altitude",
-            "Barometer temperature",
-            "Pressure",
-        ]
-        if len(subplot_titles) != rows:
-            raise Exception("Number of subplots is wrong")
-
-        fig = make_subplots(
-            rows=rows,
-            cols=1,
-            vertical_spacing=0.02,
-            shared_xaxes=True,
-            subplot_titles=subplot_titles,
-        )
-
-        fig.add_trace(
-            col=1,
-            row=1,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"baro_alt_meter"],
-                mode="lines",
-                name=f"Barometer altitude",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=2,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"baro_temp_celcius"],
-                mode="lines",
-                name=f"Barometer temperature",
-            ),
-        )
-
-        fig.add_trace(
-            col=1,
-            row=3,
-            trace=go.Scatter(
-                x=df[timestamp_field],
-                y=df[f"baro_pressure_pa"],
-                mode="lines",
-                name=f"Barometer pressure",
-            ),
-        )
-
-        format_figure(fig)
-
-        # show x axis labels in every subplot
-        fig.update_layout(
-            title_text=f"Vehicle air data {dataset_num}",
-            autosize=True,
-            xaxis_showticklabels=True,
-            xaxis2_showticklabels=True,
-            xaxis3_showticklabels=True,
-            yaxis={"ticksuffix": " m"},
-            yaxis2={"ticksuffix": " °C"},
-            yaxis3={"ticksuffix": " pa"},
-        )
-
-        figs.append(fig)
-
-    return figs
+    return render_figure(figure_spec, df, time_base, f"{figure_title} {dataset_num}")